@@ -0,0 +1,107 @@
+"""
+Hami generate_xml_epg 效能測試
+
+以合成節目表（預設 500 個頻道 × 7 天）比較舊版逐頻道掃描全部節目的分組方式 (O(頻道數 × 節目數))
+與group_programs_by_channel單次遍歷的分組方式 (O(節目數))。兩者使用相同的Programme輸入及相同的
+XMLTVWriter寫入，分別顯示分組耗時及含寫入檔案的總耗時，並在不同頻道數下顯示耗時的增長趨勢。
+
+用法: python benchmarks/bench_hami_xml.py [--channels 500] [--days 7] [--per-day 24]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import Hami  # noqa: E402
+from programme import Programme  # noqa: E402
+from xmltv_writer import XMLTVWriter  # noqa: E402
+
+BASE_TIME = 1735660800  # 2025-01-01 00:00 台北時間
+
+
+def build_guide(channel_count, days, per_day):
+    """建立合成的頻道及節目資料，節目順序打亂以模擬並行獲取的結果"""
+    step = 24 * 3600 // per_day
+    channels = []
+    programs = []
+    for c in range(channel_count):
+        content_pk = f"OTT_LIVE_{c:07d}"
+        channels.append({"channelId": content_pk, "channelName": f"頻道{c}", "contentPk": content_pk})
+        for i in range(days * per_day):
+            start = BASE_TIME + step * i
+            programs.append(Programme(content_pk, start, start + step, f"節目{i % 50}",
+                                      "節目簡介" if i % 3 else ""))
+    random.Random(0).shuffle(programs)
+    return channels, programs
+
+
+def legacy_group(channels, programs):
+    """舊版分組方式：每個頻道掃描一次全部節目"""
+    programs_by_channel = {}
+    for channel in channels:
+        channel_programs = [p for p in programs if p.channel == channel["contentPk"]]
+        channel_programs.sort(key=lambda p: p.start)
+        programs_by_channel[channel["contentPk"]] = channel_programs
+    return programs_by_channel
+
+
+def grouped_index(channels, programs):
+    return Hami.group_programs_by_channel(programs)
+
+
+def write_epg(channels, programs_by_channel, output_file):
+    """與Hami.generate_xml_epg相同的寫入部分，兩種分組方式共用"""
+    root_attrs = {"info-name": "Hami電視節目表", "info-url": "https://hamivideo.hinet.net/"}
+    with XMLTVWriter(output_file, root_attrs) as writer:
+        for channel in channels:
+            channel_id = channel["channelName"]
+            writer.write_channel(channel_id, channel["channelName"])
+            for program in programs_by_channel.get(channel["contentPk"], []):
+                writer.write_programme(channel_id, program.xmltv_start(), program.xmltv_stop(),
+                                       program.title, desc=program.desc)
+
+
+def run(group, channels, programs, output_file):
+    """返回 (分組耗時, 含寫入的總耗時)"""
+    start = time.perf_counter()
+    programs_by_channel = group(channels, programs)
+    group_time = time.perf_counter() - start
+    write_epg(channels, programs_by_channel, output_file)
+    return group_time, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hami generate_xml_epg 效能測試')
+    parser.add_argument('--channels', type=int, default=500, help='頻道數 (默認: 500)')
+    parser.add_argument('--days', type=int, default=7, help='天數 (默認: 7)')
+    parser.add_argument('--per-day', type=int, default=24, help='每天節目數 (默認: 24)')
+    args = parser.parse_args()
+
+    print(f"{'頻道數':>8} {'節目數':>10} {'舊版分組(秒)':>14} {'分組索引(秒)':>14} {'分組加速比':>10} "
+          f"{'舊版總計(秒)':>14} {'分組索引總計(秒)':>18}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_file = os.path.join(tmp_dir, 'legacy.xml')
+        grouped_file = os.path.join(tmp_dir, 'grouped.xml')
+        actual_file = os.path.join(tmp_dir, 'hami.xml')
+        for fraction in (4, 2, 1):
+            channel_count = max(1, args.channels // fraction)
+            channels, programs = build_guide(channel_count, args.days, args.per_day)
+
+            legacy_group_time, legacy_total = run(legacy_group, channels, programs, legacy_file)
+            grouped_group_time, grouped_total = run(grouped_index, channels, programs, grouped_file)
+
+            # 兩種分組方式的輸出必須一致，且與Hami.generate_xml_epg的輸出相同
+            Hami.generate_xml_epg(channels, programs, actual_file)
+            with open(legacy_file, 'rb') as legacy, open(grouped_file, 'rb') as grouped, \
+                    open(actual_file, 'rb') as actual:
+                assert legacy.read() == grouped.read() == actual.read()
+
+            print(f"{channel_count:>8} {len(programs):>10} {legacy_group_time:>14.3f} {grouped_group_time:>14.3f} "
+                  f"{legacy_group_time / grouped_group_time:>9.1f}x {legacy_total:>14.3f} {grouped_total:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+節目表合併效能測試
+
+以合成的XMLTV檔案比較ElementTree整棵解析與iterparse串流讀取的耗時及峰值記憶體（tracemalloc），
+再合併多個部分重疊的節目表，顯示合併耗時及輸出檔案與各輸入檔案總大小的比較。
+
+用法: python benchmarks/bench_merge_epg.py [--channels 150] [--days 7] [--per-day 24] [--providers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from merge_epg import merge_guides, read_guide  # noqa: E402
+from programme import format_xmltv_time  # noqa: E402
+from xmltv_writer import XMLTVWriter  # noqa: E402
+
+BASE_TIME = 1735689600  # 2025-01-01 00:00 UTC
+
+
+def write_guide(path, provider, channel_count, days, per_day):
+    """每個提供者只有部分頻道相同，節目時間略有偏移以產生重疊"""
+    step = 24 * 3600 // per_day
+    shift = provider * 300
+    with XMLTVWriter(path, {"source": f"provider{provider}"}, spool=True) as writer:
+        for c in range(provider * channel_count // 4, provider * channel_count // 4 + channel_count):
+            name = f"頻道{c}"
+            writer.write_channel(name, name, lang="zh", icon=f"https://example.com/{c}.png")
+            for i in range(days * per_day):
+                start = BASE_TIME + step * i + shift
+                writer.write_programme(name, format_xmltv_time(start), format_xmltv_time(start + step),
+                                       f"節目{i % 50}", desc="節目簡介" * 10)
+
+
+def measure(func, *args):
+    """耗時及峰值記憶體分兩次量度，避免tracemalloc本身的開銷影響耗時"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def parse_tree(path):
+    """舊方式：建立整棵樹後遍歷"""
+    root = ET.parse(path).getroot()
+    return sum(1 for _ in root.iter('programme'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='節目表合併效能測試')
+    parser.add_argument('--channels', type=int, default=150, help='每個提供者的頻道數 (默認: 150)')
+    parser.add_argument('--days', type=int, default=7, help='天數 (默認: 7)')
+    parser.add_argument('--per-day', type=int, default=24, help='每天節目數 (默認: 24)')
+    parser.add_argument('--providers', type=int, default=4, help='提供者數 (默認: 4)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = []
+        for provider in range(args.providers):
+            path = os.path.join(tmp_dir, f"provider{provider}.xml")
+            write_guide(path, provider, args.channels, args.days, args.per_day)
+            inputs.append(path)
+
+        path = inputs[0]
+        count, tree_time, tree_peak = measure(parse_tree, path)
+        (_, programmes), stream_time, stream_peak = measure(read_guide, path)
+        assert count == sum(len(p) for p in programmes.values())
+        print(f"讀取 {count} 個節目 ({os.path.getsize(path) / 1024 / 1024:.1f} MB):")
+        print(f"  ET.parse   {tree_time:>7.3f}秒  峰值 {tree_peak / 1024 / 1024:>7.1f} MB")
+        print(f"  iterparse  {stream_time:>7.3f}秒  峰值 {stream_peak / 1024 / 1024:>7.1f} MB (含保留的節目記錄)")
+
+        output_file = os.path.join(tmp_dir, 'epg.xml')
+        start = time.perf_counter()
+        merge_guides(inputs, output_file, since=BASE_TIME)
+        elapsed = time.perf_counter() - start
+        total = sum(os.path.getsize(p) for p in inputs)
+        print(f"合併 {args.providers} 個節目表耗時 {elapsed:.2f}秒: 輸入共 {total / 1024 / 1024:.1f} MB, "
+              f"輸出 {os.path.getsize(output_file) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+ofiii __NEXT_DATA__ 擷取效能測試
+
+比較以BeautifulSoup完整解析頁面與直接掃描原始位元組兩種擷取__NEXT_DATA__的方式。
+可傳入已保存的頻道頁面 (例如 curl https://www.ofiii.com/channel/watch/ofiii13 > ofiii13.html)，
+未指定時使用仿照ofiii頁面結構的合成頁面。
+
+用法: python benchmarks/bench_next_data.py [頁面檔案 ...] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from ofiii_client import extract_next_data, extract_next_data_soup  # noqa: E402
+
+
+def build_page(program_count=300):
+    """建立仿照Next.js頻道頁面的合成HTML，包含大量標記及一個__NEXT_DATA__標籤"""
+    schedule = [
+        {
+            "AirDateTime": f"2025-01-01T{i % 24:02d}:00:00Z",
+            "Duration": 3600,
+            "program": {"Title": f"節目{i}", "Description": "節目簡介<b>" * 5, "SubTitle": f"第{i}集"}
+        }
+        for i in range(program_count)
+    ]
+    next_data = {"props": {"pageProps": {"channel": {"title": "頻道", "picture": "pics/logo.png", "Schedule": schedule}}}}
+    # Next.js會將'<'轉義為<
+    payload = json.dumps(next_data, ensure_ascii=False).replace('<', '\\u003c')
+    body = ''.join(
+        f'<div class="item"><a href="/channel/watch/ofiii{i}"><img src="/pics/{i}.png" alt="頻道{i}"/>'
+        f'<span>頻道 {i}</span></a></div>'
+        for i in range(1500)
+    )
+    html = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"/><title>ofiii</title>'
+        + ''.join(f'<link rel="preload" href="/_next/static/chunks/{i}.js" as="script"/>' for i in range(40))
+        + f'</head><body><div id="__next">{body}</div>'
+        + f'<script id="__NEXT_DATA__" type="application/json">{payload}</script>'
+        + ''.join(f'<script src="/_next/static/chunks/{i}.js" async=""></script>' for i in range(40))
+        + '</body></html>'
+    )
+    return html.encode('utf-8')
+
+
+def timed(func, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(arg)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ofiii __NEXT_DATA__ 擷取效能測試')
+    parser.add_argument('pages', nargs='*', help='已保存的頻道頁面HTML檔案')
+    parser.add_argument('--repeat', type=int, default=20, help='每個頁面重複次數 (默認: 20)')
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        pages.append(('synthetic.html', build_page()))
+
+    print(f"{'頁面':<24} {'大小(KB)':>10} {'BeautifulSoup(ms)':>18} {'位元組掃描(ms)':>16} {'加速比':>8}")
+    for name, content in pages:
+        soup_time, soup_data = timed(extract_next_data_soup, content.decode('utf-8'), args.repeat)
+        scan_time, scan_data = timed(extract_next_data, content, args.repeat)
+        assert soup_data == scan_data, f"{name}: 兩種方式擷取的內容不一致"
+        print(f"{name:<24} {len(content) / 1024:>10.1f} {soup_time * 1000:>18.2f} {scan_time * 1000:>16.2f} "
+              f"{soup_time / scan_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
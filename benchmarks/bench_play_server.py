@@ -0,0 +1,96 @@
+"""
+ofiii 本地播放服務壓力測試
+
+啟動一個模擬上游（帶延遲的播放地址API及HLS播放清單）及 ofiii_play_server，
+以大量並發客戶端請求少量節目，顯示吞吐量、延遲及實際的上游請求次數，
+用於確認請求合併及緩存讓同一節目只向上游請求一次。
+
+用法: python benchmarks/bench_play_server.py [--clients 2000] [--episodes 20] [--latency 0.2] [--mode redirect]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import ofiii_play_server  # noqa: E402
+
+
+async def start_site(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def fake_upstream(latency, stats):
+    """模擬上游解析服務：延遲latency秒後以 {"url": ...} 返回播放地址，播放清單使用相對路徑"""
+    app = web.Application()
+
+    async def urls(request):
+        stats['api'] += 1
+        await asyncio.sleep(latency)
+        asset_id = request.query['asset_id']
+        base = f"http://{request.host}"
+        return web.json_response({"url": f"{base}/hls/{asset_id}/master.m3u8?expires={int(time.time()) + 3600}"})
+
+    async def playlist(request):
+        stats['playlist'] += 1
+        return web.Response(text="#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=5000000\n1080/index.m3u8\n",
+                            content_type=ofiii_play_server.HLS_CONTENT_TYPE)
+
+    app.router.add_get('/urls', urls)
+    app.router.add_get('/hls/{asset_id}/master.m3u8', playlist)
+    return app
+
+
+async def run(args):
+    stats = {'api': 0, 'playlist': 0}
+    upstream_runner, upstream = await start_site(fake_upstream(args.latency, stats))
+    app = await ofiii_play_server.create_app(upstream + "/urls?content_id={content_id}&asset_id={episode_id}", args.mode)
+    server_runner, server = await start_site(app)
+
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def client(i):
+            url = f"{server}/play/ofiii{i % args.episodes}/index.m3u8?episode_id=ep{i % args.episodes}"
+            start = time.perf_counter()
+            async with session.get(url, allow_redirects=False) as response:
+                await response.read()
+                assert response.status in (200, 302), response.status
+            latencies.append(time.perf_counter() - start)
+
+        for label in ('冷緩存', '熱緩存'):
+            latencies.clear()
+            calls_before = stats['api']
+            start = time.perf_counter()
+            await asyncio.gather(*(client(i) for i in range(args.clients)))
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            print(f"{label}: {args.clients} 個請求 {elapsed:.2f}秒 ({args.clients / elapsed:.0f} 請求/秒), "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, "
+                  f"上游API請求 {stats['api'] - calls_before} 次")
+
+    await server_runner.cleanup()
+    await upstream_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ofiii 本地播放服務壓力測試')
+    parser.add_argument('--clients', type=int, default=2000, help='並發請求數 (默認: 2000)')
+    parser.add_argument('--episodes', type=int, default=20, help='不同節目數 (默認: 20)')
+    parser.add_argument('--latency', type=float, default=0.2, help='模擬上游API延遲(秒) (默認: 0.2)')
+    parser.add_argument('--mode', choices=['redirect', 'rewrite'], default='redirect', help='播放服務模式')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+節目記錄記憶體測試
+
+比較舊版每個節目一個dict加兩個pytz datetime的表示方式與共用的Programme記錄，
+以仿照四季線上節目表的合成資料（預設 12000 個節目）解析後，顯示保留的記憶體、
+每個節目的平均位元組數、解析耗時，以及資料存活時一次完整GC的耗時。
+
+用法: python benchmarks/bench_programme_memory.py [--programs 12000] [--channels 120]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from fourgtv_epg import parse_4gtv_programs  # noqa: E402
+
+TITLES = ["新聞", "氣象", "綜藝節目", "連續劇", "卡通", "電影", "體育", "談話節目"]
+
+
+def build_items(program_count, channel_count):
+    """建立4GTV ProgList格式的JSON文字，每個頻道一份，標題及簡介按實際情況大量重複"""
+    per_channel = max(1, program_count // channel_count)
+    base = datetime(2025, 1, 1)
+    step = timedelta(minutes=30)
+    guide = []
+    for c in range(channel_count):
+        items = []
+        for i in range(per_channel):
+            start = base + step * i
+            end = start + step
+            title = TITLES[(c + i) % len(TITLES)]
+            items.append({
+                "sdate": start.strftime("%Y-%m-%d"), "stime": start.strftime("%H:%M:%S"),
+                "edate": end.strftime("%Y-%m-%d"), "etime": end.strftime("%H:%M:%S"),
+                "title": title, "content": f"{title}：本節目為{title}，敬請收看。"
+            })
+        guide.append((f"4gtv-live-{c:03d}", f"頻道{c}", json.dumps(items, ensure_ascii=False)))
+    return guide
+
+
+def legacy_parse(data, channel_id, channel_name):
+    """舊版實作：每個節目一個dict及兩個帶時區的datetime"""
+    programs = []
+    tz = pytz.timezone('Asia/Taipei')
+    for item in data:
+        start_time = tz.localize(datetime.strptime(f"{item['sdate']} {item['stime']}", "%Y-%m-%d %H:%M:%S"))
+        end_time = tz.localize(datetime.strptime(f"{item['edate']} {item['etime']}", "%Y-%m-%d %H:%M:%S"))
+        programs.append({
+            "channelId": channel_id,
+            "channelName": channel_name,
+            "programName": item["title"],
+            "description": item.get("content", ""),
+            "start": start_time,
+            "end": end_time
+        })
+    return programs
+
+
+def compact_parse(data, channel_id, channel_name):
+    return parse_4gtv_programs(data, channel_name)
+
+
+def measure(parse, guide):
+    """
+    返回 (節目列表, 保留的位元組數, 解析耗時, 完整GC耗時)
+    與實際執行相同，每個頻道的JSON解析後即丟棄，只有節目記錄保留下來
+    """
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    programs = []
+    for channel_id, channel_name, text in guide:
+        programs.extend(parse(json.loads(text), channel_id, channel_name))
+    elapsed = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start
+    return programs, retained, elapsed, gc_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='節目記錄記憶體測試')
+    parser.add_argument('--programs', type=int, default=12000, help='節目數 (默認: 12000)')
+    parser.add_argument('--channels', type=int, default=120, help='頻道數 (默認: 120)')
+    args = parser.parse_args()
+
+    guide = build_items(args.programs, args.channels)
+
+    # 兩種表示方式的輸出內容必須一致
+    channel_id, channel_name, text = guide[0]
+    for legacy, compact in zip(legacy_parse(json.loads(text), channel_id, channel_name),
+                               compact_parse(json.loads(text), channel_id, channel_name)):
+        assert legacy["start"].strftime("%Y%m%d%H%M%S %z") == compact.xmltv_start()
+        assert legacy["end"].strftime("%Y%m%d%H%M%S %z") == compact.xmltv_stop()
+        assert legacy["programName"] == compact.title and legacy["description"] == compact.desc
+
+    print(f"{'表示方式':<14} {'節目數':>8} {'保留(MB)':>10} {'每節目(B)':>10} {'解析(秒)':>10} {'GC(毫秒)':>10}")
+    for name, parse in (("dict+datetime", legacy_parse), ("Programme", compact_parse)):
+        # 每次只有一種表示方式存活，GC耗時不受另一組資料影響
+        programs, retained, elapsed, gc_time = measure(parse, guide)
+        print(f"{name:<14} {len(programs):>8} {retained / 1024 / 1024:>10.2f} {retained / len(programs):>10.0f} "
+              f"{elapsed:>10.3f} {gc_time * 1000:>10.2f}")
+        del programs
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+XMLTV 寫入效能測試
+
+比較 ofiii_epg 舊版的 ElementTree + minidom 美化輸出與串流寫入的 XMLTVWriter，
+顯示不同節目表大小下的耗時與峰值記憶體（tracemalloc），並確認兩者輸出內容一致。
+
+用法: python benchmarks/bench_xmltv_writer.py [--channels 200] [--days 7] [--per-day 24]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from xml.dom import minidom
+from xml.etree import ElementTree as ET
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from xmltv_writer import XMLTVWriter  # noqa: E402
+
+ROOT_ATTRS = {"generator": "OFIII-EPG-Generator", "source": "www.ofiii.com"}
+
+
+def build_guide(channel_count, days, per_day):
+    tz = pytz.timezone('Asia/Taipei')
+    base = tz.localize(datetime(2025, 1, 1))
+    step = timedelta(minutes=24 * 60 // per_day)
+    channels = [
+        {"id": f"ofiii{c}", "channelName": f"頻道{c}", "logo": f"https://example.com/{c}.png", "description": "簡介 & 說明"}
+        for c in range(channel_count)
+    ]
+    programs = []
+    for channel in channels:
+        for i in range(days * per_day):
+            start = base + step * i
+            programs.append({
+                "channelName": channel["id"],
+                "programName": f"節目 <{i % 50}>",
+                "description": "節目簡介" * 10,
+                "subtitle": f"第{i}集",
+                "start": start,
+                "end": start + step
+            })
+    return channels, programs
+
+
+def write_legacy(channels, programs, output_file):
+    """舊版實作：建立整棵ElementTree後以minidom美化"""
+    root = ET.Element("tv", **ROOT_ATTRS)
+    for channel in channels:
+        channel_elem = ET.SubElement(root, "channel", id=channel['id'])
+        ET.SubElement(channel_elem, "display-name", lang="zh").text = channel['channelName']
+        ET.SubElement(channel_elem, "icon", src=channel['logo'])
+        ET.SubElement(channel_elem, "desc", lang="zh").text = channel['description']
+    for program in programs:
+        program_elem = ET.SubElement(
+            root, "programme",
+            channel=program['channelName'],
+            start=program['start'].strftime('%Y%m%d%H%M%S %z'),
+            stop=program['end'].strftime('%Y%m%d%H%M%S %z')
+        )
+        ET.SubElement(program_elem, "title", lang="zh").text = program['programName']
+        ET.SubElement(program_elem, "sub-title", lang="zh").text = program['subtitle']
+        ET.SubElement(program_elem, "desc", lang="zh").text = program['description']
+    xml_str = ET.tostring(root, encoding='utf-8').decode('utf-8')
+    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="  ", encoding='utf-8')
+    with open(output_file, 'wb') as f:
+        f.write(pretty_xml)
+
+
+def write_streaming(channels, programs, output_file):
+    with XMLTVWriter(output_file, ROOT_ATTRS, indent="  ") as writer:
+        for channel in channels:
+            writer.write_channel(channel['id'], channel['channelName'], lang="zh",
+                                 icon=channel['logo'], desc=channel['description'])
+        for program in programs:
+            writer.write_programme(
+                program['channelName'],
+                program['start'].strftime('%Y%m%d%H%M%S %z'),
+                program['end'].strftime('%Y%m%d%H%M%S %z'),
+                program['programName'],
+                sub_title=program['subtitle'],
+                desc=program['description']
+            )
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def canonical(path):
+    """以(標籤, 屬性, 文字)序列比較兩個檔案的內容，忽略空白縮排"""
+    return [
+        (elem.tag, sorted(elem.attrib.items()), (elem.text or '').strip())
+        for elem in ET.parse(path).getroot().iter()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XMLTV 寫入效能測試')
+    parser.add_argument('--channels', type=int, default=200, help='頻道數 (默認: 200)')
+    parser.add_argument('--days', type=int, default=7, help='天數 (默認: 7)')
+    parser.add_argument('--per-day', type=int, default=24, help='每天節目數 (默認: 24)')
+    args = parser.parse_args()
+
+    print(f"{'節目數':>8} {'ET+minidom(秒)':>15} {'峰值(MB)':>10} {'串流(秒)':>10} {'峰值(MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_file = os.path.join(tmp_dir, 'legacy.xml')
+        streaming_file = os.path.join(tmp_dir, 'streaming.xml')
+        for fraction in (4, 2, 1):
+            channels, programs = build_guide(max(1, args.channels // fraction), args.days, args.per_day)
+
+            legacy_time, legacy_peak = measure(write_legacy, channels, programs, legacy_file)
+            streaming_time, streaming_peak = measure(write_streaming, channels, programs, streaming_file)
+
+            assert canonical(legacy_file) == canonical(streaming_file), "兩種實作的輸出內容不一致"
+
+            print(f"{len(programs):>8} {legacy_time:>15.3f} {legacy_peak / 2 ** 20:>10.1f} "
+                  f"{streaming_time:>10.3f} {streaming_peak / 2 ** 20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
 import asyncio
+import argparse
+import hashlib
+import json
 import os
+import random
+import time
 import pytz
-import requests
-import xml.etree.ElementTree as ET
+import aiohttp
 from datetime import datetime, timedelta
 from loguru import logger
+from json_cache import load_json_cache, save_json_cache
+from xmltv_writer import XMLTVWriter
+from programme import TAIPEI_OFFSET, Programme, parse_timestamp
 
 UA = "HamiVideo/7.12.806(Android 11;GM1910) OKHTTP/3.12.2"
 headers = {
@@ -15,9 +22,48 @@ headers = {
 # 設置超時時間（秒）
 REQUEST_TIMEOUT = 30
 MAX_RETRIES = 3
-RETRY_DELAY = 10
+# 指數退避的基礎延遲與上限（秒）
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+# 整個執行過程中允許的總重試次數
+RETRY_BUDGET = 200
+# 獲取的天數
+EPG_DAYS = 7
+# 緩存設置：前幾天每次都重新獲取，其餘日期緩存超過多久（秒）才重新獲取
+ALWAYS_REFRESH_DAYS = 2
+CACHE_MAX_AGE = 72 * 3600
+CACHE_VERSION = 2
+# 每個主機的最大並發連線數
+MAX_CONCURRENCY = 10
+# 閒置連線保持時間（秒）
+KEEPALIVE_TIMEOUT = 30
 
-async def request_channel_list():
+def create_session(concurrency=MAX_CONCURRENCY):
+    """建立共用連線池的非阻塞HTTP會話"""
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300
+    )
+    # 不設total，避免在連線池中排隊等待的時間也計入超時
+    timeout = aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout)
+
+async def fetch_json(session, url, params):
+    """
+    發送GET請求並解析JSON，429/5xx拋出異常以便重試，其他非200狀態碼返回None
+    None表示獲取失敗，與返回空節目表不同，調用方不可將其當作空節目表緩存
+    """
+    async with session.get(url, params=params) as response:
+        if response.status == 429 or response.status >= 500:
+            response.raise_for_status()
+        if response.status != 200:
+            return None
+        # Hami的API不一定返回application/json，因此不檢查Content-Type
+        return await response.json(content_type=None)
+
+async def request_channel_list(session):
     params = {
         "appVersion": "7.12.806",
         "deviceType": "1",
@@ -28,9 +74,8 @@ async def request_channel_list():
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getUILayoutById.php"
     channel_list = []
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
-        if response.status_code == 200:
-            data = response.json()
+        data = await fetch_json(session, url, params)
+        if data is not None:
             elements = []
 
             for info in data.get("UIInfo", []):
@@ -49,163 +94,254 @@ async def request_channel_list():
     
     return channel_list
 
-async def get_programs_with_retry(channel):
-    retries = 0
+class RetryBudget:
+    """整個執行過程共用的重試額度，避免大量失敗時無止境地重試"""
 
-    while retries < MAX_RETRIES:
-        try:
-            programs = await request_epg(channel['channelName'], channel['contentPk'])
-            return programs
-        except Exception as e:
-            retries += 1
-            print(f"請求 {channel['channelName']} 的EPG時出錯: {e}")
-            print(f"將在 {RETRY_DELAY} 秒後重試 ({retries}/{MAX_RETRIES})")
-            await asyncio.sleep(RETRY_DELAY)
-    
-    logger.warning(f"{channel['channelName']} 達到最大重試次數，跳過...")
-    return []
+    def __init__(self, total=RETRY_BUDGET):
+        self.remaining = total
 
-async def request_all_epg():
-    print("開始獲取頻道列表...")
-    rawChannels = await request_channel_list()
-    print(f"找到 {len(rawChannels)} 個頻道")
-    
-    all_programs = []
+    def acquire(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+def backoff_delay(attempt):
+    """指數退避加上隨機抖動 (full jitter)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def get_epg_dates(days=EPG_DAYS):
+    """返回從今天起（台北時間）的日期字串列表"""
+    today = datetime.now(pytz.timezone('Asia/Taipei'))
+    return [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+
+def load_epg_cache(cache_file):
+    """讀取每日節目表緩存，檔案不存在或損壞時返回空緩存"""
+    try:
+        data = load_json_cache(cache_file, CACHE_VERSION)
+        return data.get('entries', {}) if data else {}
+    except Exception as e:
+        logger.warning(f"讀取節目表緩存失敗，將重新獲取: {e}")
+        return {}
+
+def save_epg_cache(cache_file, entries, dates):
+    """寫入每日節目表緩存，並移除已不在節目表範圍內的日期"""
+    if not cache_file:
+        return
+    entries = {key: entry for key, entry in entries.items() if key.split('|', 1)[1] in dates}
+    save_json_cache(cache_file, {'entries': entries}, CACHE_VERSION)
+
+def cache_key(content_pk, date):
+    return f"{content_pk}|{date}"
+
+def programs_to_cache(programs):
+    """將節目轉為可序列化格式並計算內容雜湊"""
+    serialized = [program.to_list() for program in programs]
+    digest = hashlib.sha256(
+        json.dumps(serialized, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return serialized, digest
+
+def programs_from_cache(serialized, content_pk):
+    return [Programme.from_list(content_pk, item) for item in serialized]
+
+def needs_refresh(entry, day_index, now):
+    """
+    緩存刷新策略:
+    - 今天及明天（前 ALWAYS_REFRESH_DAYS 天）每次都重新獲取
+    - 沒有緩存的日期（例如新加入範圍的第7天）需要獲取
+    - 其餘日期只有在緩存超過 CACHE_MAX_AGE 時才重新獲取
+    """
+    if day_index < ALWAYS_REFRESH_DAYS or entry is None:
+        return True
+    return now - entry.get('fetched_at', 0) > CACHE_MAX_AGE
+
+async def request_all_epg(concurrency=MAX_CONCURRENCY, cache_file=None):
+    cache = load_epg_cache(cache_file)
+    now = time.time()
     
-    # 使用asyncio.gather並行獲取所有頻道的節目
-    tasks = []
-    for channel in rawChannels:
-        tasks.append(get_programs_with_retry(channel))
+    async with create_session(concurrency) as session:
+        print("開始獲取頻道列表...")
+        rawChannels = await request_channel_list(session)
+        print(f"找到 {len(rawChannels)} 個頻道")
+        
+        # 每個 (頻道, 日期) 都是獨立的請求單元，並發數由連線池限制
+        dates = get_epg_dates()
+        budget = RetryBudget()
+        units = []
+        tasks = []
+        for channel in rawChannels:
+            for day_index, date in enumerate(dates):
+                key = cache_key(channel['contentPk'], date)
+                units.append((key, channel['contentPk']))
+                if needs_refresh(cache.get(key), day_index, now):
+                    tasks.append(request_epg(session, channel, date, budget))
+                else:
+                    tasks.append(None)
+        
+        print(f"需要請求 {sum(task is not None for task in tasks)}/{len(tasks)} 個 (頻道, 日期)，其餘使用緩存")
+        fetched = iter(await asyncio.gather(*[task for task in tasks if task is not None]))
     
-    results = await asyncio.gather(*tasks)
+    all_programs = []
+    changed = 0
     
-    for programs in results:
+    for (key, content_pk), task in zip(units, tasks):
+        entry = cache.get(key)
+        programs = next(fetched) if task is not None else None
+        
+        if programs is not None:
+            serialized, digest = programs_to_cache(programs)
+            if entry is None or entry.get('hash') != digest:
+                changed += 1
+            cache[key] = {'fetched_at': now, 'hash': digest, 'programs': serialized}
+        elif entry is not None:
+            # 未請求或請求失敗時使用緩存，並保留原有的fetched_at，失敗不會延後下次重新請求的時間
+            programs = programs_from_cache(entry['programs'], content_pk)
+        
         if programs:
             all_programs.extend(programs)
     
+    if cache_file:
+        print(f"節目表有變更的 (頻道, 日期): {changed} 個")
+        save_epg_cache(cache_file, cache, set(dates))
+    
     print(f"共獲取 {len(all_programs)} 個節目")
     return rawChannels, all_programs
 
-async def request_epg(channel_name: str, content_pk: str):
+async def request_epg(session, channel, date, budget):
+    """獲取單一頻道單一日期的節目表，暫時性錯誤時僅重試該請求，最終失敗返回None"""
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getEpgByContentIdAndDate.php"
-    print(f"獲取 {channel_name} 的節目表...")
-    
-    epgResult = []
-    today = datetime.now(pytz.timezone('Asia/Taipei'))
+    channel_name = channel['channelName']
+    content_pk = channel['contentPk']
+    params = {
+        "deviceType": "1",
+        "Date": date,
+        "contentPk": content_pk,
+    }
     
-    for i in range(7):
-        date = today + timedelta(days=i)
-        formatted_date = date.strftime('%Y-%m-%d')
-        params = {
-            "deviceType": "1",
-            "Date": formatted_date,
-            "contentPk": content_pk,
-        }
-        
+    attempt = 0
+    while True:
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
-            if response.status_code == 200:
-                data = response.json()
-                ui_info = data.get('UIInfo', [])
-                if ui_info:
-                    elements = ui_info[0].get('elements', [])
-                    for element in elements:
-                        program_info_list = element.get('programInfo', [])
-                        if program_info_list:
-                            program_info = program_info_list[0]
-                            start_time, end_time = hami_time_to_datetime(program_info['hintSE'])
-                            
-                            epgResult.append({
-                                "channelId": content_pk,
-                                "channelName": element.get('title', ''),
-                                "programName": program_info.get('programName', ''),
-                                "description": program_info.get('description', ''),
-                                "start": start_time,
-                                "end": end_time
-                            })
+            data = await fetch_json(session, url, params)
+            if data is None:
+                # 403/404等非200狀態碼：視為獲取失敗，保留該日期原有的緩存
+                logger.warning(f"{channel_name} 在 {date} 的節目表請求被拒絕，保留緩存")
+                return None
+            return parse_epg(data, content_pk)
+        except (KeyError, ValueError, TypeError) as e:
+            # 內容無法解析，重試也會得到相同結果，不消耗共用的重試額度
+            logger.warning(f"解析 {channel_name} 在 {date} 的節目表失敗，跳過: {e}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 只重試連線錯誤、超時及429/5xx (fetch_json以ClientResponseError拋出)
+            print(f"獲取 {channel_name} 在 {date} 的節目表時出錯: {e}")
+            attempt += 1
+            if attempt >= MAX_RETRIES:
+                logger.warning(f"{channel_name} 在 {date} 達到最大重試次數，跳過...")
+                return None
+            if not budget.acquire():
+                logger.warning(f"重試額度已用盡，跳過 {channel_name} 在 {date} 的節目表")
+                return None
+            delay = backoff_delay(attempt)
+            print(f"將在 {delay:.2f} 秒後重試 {channel_name} 在 {date} 的節目表 ({attempt}/{MAX_RETRIES})")
+            await asyncio.sleep(delay)
         except Exception as e:
-            print(f"獲取 {channel_name} 在 {formatted_date} 的節目表時出錯: {e}")
+            # 其他非暫時性錯誤同樣不重試，避免單一頻道中斷整個並發請求
+            logger.warning(f"獲取 {channel_name} 在 {date} 的節目表失敗，跳過: {e}")
+            return None
+
+def parse_epg(data, content_pk):
+    """解析節目表API的返回內容"""
+    epgResult = []
+    if data is None:
+        return epgResult
+    
+    ui_info = data.get('UIInfo', [])
+    if ui_info:
+        elements = ui_info[0].get('elements', [])
+        for element in elements:
+            program_info_list = element.get('programInfo', [])
+            if program_info_list:
+                program_info = program_info_list[0]
+                start_time, end_time = hami_time_to_timestamps(program_info['hintSE'])
+                
+                epgResult.append(Programme(
+                    content_pk,
+                    start_time,
+                    end_time,
+                    program_info.get('programName', ''),
+                    program_info.get('description', '')
+                ))
     
     return epgResult
 
-def hami_time_to_datetime(time_range: str):
+def hami_time_to_timestamps(time_range: str):
+    """將台灣時間的 "開始~結束" 轉為epoch秒數"""
     start_time_str, end_time_str = time_range.split('~')
-    start_time = datetime.strptime(start_time_str, "%Y-%m-%d %H:%M:%S")
-    end_time = datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S")
-    shanghai_tz = pytz.timezone('Asia/Taipei')
-    start_time_shanghai = shanghai_tz.localize(start_time)
-    end_time_shanghai = shanghai_tz.localize(end_time)
-    return start_time_shanghai, end_time_shanghai
-
-def generate_xml_epg(channels, programs):
-    # 建立XML結構
-    root = ET.Element("tv")
-    root.set("info-name", "Hami電視節目表")
-    root.set("info-url", "https://hamivideo.hinet.net/")
-    
-    channel_name_map = {}
-    for channel in channels:
-        channel_name_map[channel["contentPk"]] = channel["channelName"]
-    
-    # 按頻道順序處理
-    for channel in channels:
-        # 使用頻道名稱作為ID
-        channel_id = channel["channelName"]
-        
-        # 添加頻道元素
-        channel_elem = ET.SubElement(root, "channel")
-        channel_elem.set("id", channel_id)
-        
-        display_name = ET.SubElement(channel_elem, "display-name")
-        display_name.text = channel["channelName"]
-        
-        channel_programs = [
-            p for p in programs 
-            if p["channelId"] == channel["contentPk"]
-        ]
-        
-        # 按開始時間排序
-        channel_programs.sort(key=lambda p: p["start"])
-        
-        for program in channel_programs:
-            programme = ET.SubElement(root, "programme")
-            programme.set("start", program["start"].strftime("%Y%m%d%H%M%S %z"))
-            programme.set("stop", program["end"].strftime("%Y%m%d%H%M%S %z"))
-            programme.set("channel", channel_id)
-            
-            title = ET.SubElement(programme, "title")
-            title.set("lang", "zh")
-            title.text = program["programName"]
-            
-            if program["description"]:
-                desc = ET.SubElement(programme, "desc")
-                desc.set("lang", "zh")
-                desc.text = program["description"]
+    return parse_timestamp(start_time_str, TAIPEI_OFFSET), parse_timestamp(end_time_str, TAIPEI_OFFSET)
+
+def group_programs_by_channel(programs):
+    """按頻道分組節目，每組按開始時間排序一次"""
+    programs_by_channel = {}
+    for program in programs:
+        programs_by_channel.setdefault(program.channel, []).append(program)
+    
+    for channel_programs in programs_by_channel.values():
+        channel_programs.sort(key=lambda p: p.start)
+    
+    return programs_by_channel
+
+def generate_xml_epg(channels, programs, output_file):
+    root_attrs = {
+        "info-name": "Hami電視節目表",
+        "info-url": "https://hamivideo.hinet.net/"
+    }
+    
+    # 單次遍歷按頻道分組節目，避免每個頻道都掃描全部節目
+    programs_by_channel = group_programs_by_channel(programs)
     
-    # 建立XML樹
-    tree = ET.ElementTree(root)
-    return tree
+    with XMLTVWriter(output_file, root_attrs) as writer:
+        # 按頻道順序處理
+        for channel in channels:
+            # 使用頻道名稱作為ID
+            channel_id = channel["channelName"]
+            writer.write_channel(channel_id, channel["channelName"])
+            
+            for program in programs_by_channel.get(channel["contentPk"], []):
+                writer.write_programme(
+                    channel_id,
+                    program.xmltv_start(),
+                    program.xmltv_stop(),
+                    program.title,
+                    desc=program.desc
+                )
 
 async def main():
+    parser = argparse.ArgumentParser(description='Hami電視節目表')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY,
+                        help=f'每個主機的最大並發請求數 (默認: {MAX_CONCURRENCY})')
+    parser.add_argument('--cache-file', type=str, default=None,
+                        help='每日節目表緩存檔案 (默認: cache/hami_epg.json)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用緩存，重新獲取所有日期')
+    args = parser.parse_args()
+    
     print("開始生成Hami電視節目表...")
     
     # 建立輸出目錄
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
+    cache_file = None if args.no_cache else (args.cache_file or os.path.join(project_root, "cache", "hami_epg.json"))
     output_dir = os.path.join(project_root, "output")
     os.makedirs(output_dir, exist_ok=True)
     
     print(f"輸出目錄: {output_dir}")
     
     # 獲取頻道和節目數據
-    channels, programs = await request_all_epg()
+    channels, programs = await request_all_epg(args.concurrency, cache_file)
     
     # 生成XML EPG
-    xml_tree = generate_xml_epg(channels, programs)
     output_file = os.path.join(output_dir, "hami.xml")
-    
-    # 正確寫入XML文件
-    xml_tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    generate_xml_epg(channels, programs, output_file)
     
     print(f"電視節目表已成功生成: {output_file}")
     print(f"檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
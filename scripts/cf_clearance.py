@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+from json_cache import load_json_cache, save_json_cache
+
+# 通過Cloudflare驗證後取得的Cookie
+CLEARANCE_COOKIE = "cf_clearance"
+# 距離過期不足此秒數的驗證視為無效，避免執行中途過期
+EXPIRY_MARGIN = 300
+STATE_VERSION = 1
+
+_lock = threading.Lock()
+
+
+def current_clearance(scraper):
+    """返回scraper目前的cf_clearance值，沒有時返回None"""
+    for cookie in scraper.cookies:
+        if cookie.name == CLEARANCE_COOKIE:
+            return cookie.value
+    return None
+
+
+def load_clearance(scraper, state_file, margin=EXPIRY_MARGIN):
+    """
+    讀取已保存的Cloudflare驗證狀態並套用到scraper
+    只有cf_clearance尚未過期時才會套用，返回是否成功套用
+    """
+    try:
+        state = load_json_cache(state_file, STATE_VERSION)
+    except (OSError, ValueError):
+        return False
+    if state is None:
+        return False
+
+    now = time.time()
+    cookies = [
+        cookie for cookie in state.get('cookies', [])
+        if cookie.get('expires') is None or cookie['expires'] > now + margin
+    ]
+    # 驗證Cookie與取得它時使用的User-Agent綁定，兩者缺一不可
+    if not state.get('user_agent') or not any(c['name'] == CLEARANCE_COOKIE for c in cookies):
+        return False
+
+    scraper.headers['User-Agent'] = state['user_agent']
+    for cookie in cookies:
+        scraper.cookies.set(
+            cookie['name'],
+            cookie['value'],
+            domain=cookie.get('domain', ''),
+            path=cookie.get('path', '/'),
+            expires=cookie.get('expires'),
+            secure=cookie.get('secure', False)
+        )
+    return True
+
+
+def save_clearance(scraper, state_file):
+    """保存scraper目前的Cookie及User-Agent，沒有cf_clearance時不寫入，返回是否已保存"""
+    if not state_file:
+        return False
+
+    cookies = [
+        {
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'expires': cookie.expires,
+            'secure': cookie.secure
+        }
+        for cookie in scraper.cookies
+    ]
+    if not any(c['name'] == CLEARANCE_COOKIE for c in cookies):
+        return False
+
+    state = {
+        'saved_at': time.time(),
+        'user_agent': scraper.headers.get('User-Agent', ''),
+        'cookies': cookies
+    }
+    save_json_cache(state_file, state, STATE_VERSION, indent=2)
+    return True
+
+
+def clear_clearance(scraper, state_file=None, rejected=None):
+    """
+    驗證被拒絕時清除Cookie及已保存的狀態，讓下一個請求重新通過驗證
+    指定rejected時，只有目前的cf_clearance仍是被拒絕的那個才清除，
+    避免多個執行緒同時清除其他執行緒剛取得的新驗證
+    """
+    with _lock:
+        if rejected is not None and current_clearance(scraper) != rejected:
+            return False
+        scraper.cookies.clear()
+        if state_file and os.path.exists(state_file):
+            os.remove(state_file)
+        return True
@@ -0,0 +1,193 @@
+import abc
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from rate_limiter import TokenBucket
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+
+
+class ProviderContext:
+    """
+    所有提供者共用的執行環境：輸出及緩存目錄、按主機建立的令牌桶及HTTP會話
+    同一主機的令牌桶及會話只建立一次，由context擁有並在close()時關閉，
+    取得同一主機的提供者共用同一個限速及連接池；4GTV及ofiii的requests會話及令牌桶由此取得。
+    Hami使用aiohttp，會話綁定在提供者執行緒自己的事件迴圈上，無法跨執行緒共用，因此由Hami自行建立及關閉；
+    4GTV的cloudscraper保存該次執行的Cloudflare驗證狀態，同樣由4GTV自行建立
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, cache_dir=CACHE_DIR, use_cache=True):
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self._limiters = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def cache_file(self, name):
+        """返回緩存檔案路徑，停用緩存時返回None"""
+        return os.path.join(self.cache_dir, name) if self.use_cache else None
+
+    def limiter(self, host, rate, jitter=0.0):
+        """返回主機共用的令牌桶，第一次請求時按rate建立"""
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = TokenBucket(rate, jitter=jitter)
+            return self._limiters[host]
+
+    def session(self, host, factory):
+        """返回主機共用的HTTP會話，第一次請求時由factory建立"""
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = factory()
+            return self._sessions[host]
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+
+
+class Provider(abc.ABC):
+    """EPG提供者的共同介面：run()生成輸出檔案並返回其路徑列表"""
+
+    name = None
+
+    @abc.abstractmethod
+    def run(self, context):
+        """使用context提供的目錄、令牌桶及會話生成輸出檔案，返回其路徑列表"""
+
+
+class HamiProvider(Provider):
+    name = 'hami'
+
+    def run(self, context):
+        import Hami
+
+        # Hami使用aiohttp，在本執行緒的事件迴圈中執行，會話綁定該事件迴圈，因此不經context共用
+        channels, programs = asyncio.run(Hami.request_all_epg(Hami.MAX_CONCURRENCY, context.cache_file('hami_epg.json')))
+        output_file = os.path.join(context.output_dir, 'hami.xml')
+        Hami.generate_xml_epg(channels, programs, output_file)
+        return [output_file]
+
+
+class FourgTVProvider(Provider):
+    name = '4gtv'
+
+    def run(self, context):
+        import fourgtv_epg
+
+        limiter = context.limiter('www.4gtv.tv', fourgtv_epg.REQUESTS_PER_SECOND, fourgtv_epg.REQUEST_JITTER)
+        session = context.session('www.4gtv.tv', fourgtv_epg.create_session)
+        channels, programs = fourgtv_epg.get_4gtv_epg(
+            cache_file=context.cache_file('fourgtv_proglist.json'),
+            state_file=os.path.join(context.cache_dir, 'cf_clearance.json'),
+            limiter=limiter,
+            session=session,
+            output_dir=context.output_dir
+        )
+        output_file = os.path.join(context.output_dir, '4g.xml')
+        fourgtv_epg.generate_xml(channels, programs, output_file)
+        return [output_file]
+
+
+class OfiiiProvider(Provider):
+    """ofiii的EPG、M3U及頻道JSON共用同一次抓取"""
+
+    name = 'ofiii'
+    workers = 4
+
+    def run(self, context):
+        import ofiii_client
+        import ofiii_epg
+        from generate_ofiii_m3u import OfiiiM3UBuilder, get_channel_ids
+
+        session = context.session('www.ofiii.com', lambda: ofiii_client.create_session(self.workers))
+        client = ofiii_client.OfiiiClient(session, cache_file=context.cache_file('ofiii_build_id.json'))
+        limiter = context.limiter('www.ofiii.com', ofiii_client.CRAWL_RATE, ofiii_client.CRAWL_JITTER)
+        m3u_builder = OfiiiM3UBuilder(get_channel_ids())
+
+        xml_file = os.path.join(context.output_dir, 'ofiii.xml')
+        channels_info = ofiii_epg.get_ofiii_epg(xml_file, [m3u_builder], self.workers, client=client, limiter=limiter)
+        if not channels_info:
+            raise RuntimeError("未獲取到有效頻道信息")
+
+        json_file = os.path.join(context.output_dir, 'ofiii.json')
+        ofiii_epg.generate_json_file(channels_info, json_file)
+        m3u_builder.write(context.output_dir)
+        return [xml_file, json_file] + [
+            os.path.join(context.output_dir, name)
+            for name in ('ofiii.m3u', 'ofiii_channel.json', 'ofiii_playout-channel.json')
+        ]
+
+
+PROVIDERS = {provider.name: provider for provider in (HamiProvider, FourgTVProvider, OfiiiProvider)}
+
+
+def run_providers(names, context):
+    """
+    在同一個進程中並行執行所選的提供者，每個提供者一個執行緒
+    總耗時約等於最慢的提供者，返回 {名稱: (是否成功, 耗時秒數, 輸出檔案或錯誤)}
+    """
+    def run(name):
+        start = time.perf_counter()
+        logger.info(f"[{name}] 開始")
+        try:
+            outputs = PROVIDERS[name]().run(context)
+            elapsed = time.perf_counter() - start
+            logger.success(f"[{name}] 完成，耗時 {elapsed:.1f}秒")
+            return name, (True, elapsed, outputs)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            logger.exception(f"[{name}] 失敗，耗時 {elapsed:.1f}秒: {e}")
+            return name, (False, elapsed, str(e))
+
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        return dict(executor.map(run, names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='並行生成所有電視節目表')
+    parser.add_argument('--providers', default=','.join(PROVIDERS),
+                        help=f'要執行的提供者，以逗號分隔 (默認: {",".join(PROVIDERS)})')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='輸出目錄 (默認: output)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用各提供者的緩存')
+    parser.add_argument('--log-file', help='額外寫入的日誌檔案路徑')
+    args = parser.parse_args()
+
+    names = list(dict.fromkeys(name.strip() for name in args.providers.split(',') if name.strip()))
+    unknown = [name for name in names if name not in PROVIDERS]
+    if unknown or not names:
+        parser.error(f"未知的提供者: {', '.join(unknown)}，可用: {', '.join(PROVIDERS)}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.log_file:
+        logger.add(args.log_file, rotation="1 day", retention="7 days", encoding="utf-8",
+                   format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}")
+    context = ProviderContext(args.output_dir, use_cache=not args.no_cache)
+    start = time.perf_counter()
+    try:
+        results = run_providers(names, context)
+    finally:
+        context.close()
+
+    logger.info("=" * 50)
+    for name in names:
+        ok, elapsed, detail = results[name]
+        status = "✅" if ok else "❌"
+        logger.info(f"{status} {name}: {elapsed:.1f}秒, {', '.join(detail) if ok else detail}")
+    logger.info(f"總耗時 {time.perf_counter() - start:.1f}秒")
+
+    return 0 if all(ok for ok, _, _ in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
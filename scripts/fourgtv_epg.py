@@ -2,22 +2,30 @@ import os
 import json
 import requests
 import datetime
-import pytz
-import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from loguru import logger
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+import argparse
+import hashlib
+import threading
 import time
-import random
 import cloudscraper
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from json_cache import load_json_cache, save_json_cache
+from rate_limiter import TokenBucket
+from xmltv_writer import XMLTVWriter
+from programme import TAIPEI_OFFSET, Programme, parse_timestamp
+from cf_clearance import load_clearance, save_clearance, clear_clearance, current_clearance
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+# 保存Cloudflare驗證狀態，下次執行時重用
+CLEARANCE_FILE = os.path.join(BASE_DIR, 'cache', 'cf_clearance.json')
+# 保存每個頻道節目表的驗證資訊(ETag/Last-Modified/內容雜湊)及解析結果
+PROGLIST_CACHE_FILE = os.path.join(BASE_DIR, 'cache', 'fourgtv_proglist.json')
+PROGLIST_CACHE_VERSION = 2
 
 # 需要過濾的頻道名稱清單
 BLOCKED_CHANNELS = [
@@ -26,60 +34,232 @@ BLOCKED_CHANNELS = [
     "芭樂直擊台"
 ]
 
-def create_cloudscraper():
-    """建立Cloudscraper實例，繞過Cloudflare防護"""
-    return cloudscraper.create_scraper(
+# 並發獲取設置：同時進行的請求數、平均每秒請求數及每個請求的隨機延遲上限（秒）
+MAX_WORKERS = 6
+REQUESTS_PER_SECOND = 4
+REQUEST_JITTER = 0.5
+# 無頭瀏覽器等待Cloudflare驗證完成的最長時間（秒）
+BROWSER_TIMEOUT = 30
+
+PROGLIST_URL = "https://www.4gtv.tv/ProgList/{channel_id}.txt"
+BROWSER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+PROGLIST_HEADERS = {
+    "Referer": "https://www.4gtv.tv/",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Origin": "https://www.4gtv.tv",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin"
+}
+
+# 節目表檔案的獲取結果，not_modified 表示伺服器返回304
+ProgListResponse = namedtuple('ProgListResponse', ['text', 'etag', 'last_modified', 'not_modified'])
+
+def conditional_headers(entry):
+    """根據已保存的驗證資訊建立條件請求標頭"""
+    headers = dict(PROGLIST_HEADERS)
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def to_proglist_response(response):
+    if response.status_code == 304:
+        return ProgListResponse(None, response.headers.get('ETag'), response.headers.get('Last-Modified'), True)
+    response.encoding = "utf-8"
+    response.raise_for_status()
+    return ProgListResponse(response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'), False)
+
+def create_cloudscraper(state_file=CLEARANCE_FILE):
+    """建立Cloudscraper實例，繞過Cloudflare防護，並載入仍有效的驗證狀態"""
+    scraper = cloudscraper.create_scraper(
         browser={
             'browser': 'chrome',
             'platform': 'windows',
             'desktop': True
         }
     )
+    if load_clearance(scraper, state_file):
+        logger.info(f"已載入保存的Cloudflare驗證狀態: {state_file}")
+    else:
+        logger.info("沒有可用的Cloudflare驗證狀態，將在需要時重新驗證")
+    return scraper
 
 def create_session():
-    """建立帶有重試機制的會話"""
+    """建立帶有重試機制的會話，可由調用方建立後與其他任務共用"""
     session = requests.Session()
+    session.headers["User-Agent"] = BROWSER_USER_AGENT
     retry_strategy = Retry(
         total=3,
         backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
+        # 不重試503，Cloudflare以403/503返回驗證頁面，應直接改用cloudscraper
+        status_forcelist=[429, 500, 502, 504],
         allowed_methods=["GET"]
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
     return session
 
-def get_4gtv_epg():
+class ProgListFetcher:
+    """
+    分層獲取節目表檔案: 一般HTTP → cloudscraper → 無頭瀏覽器
+    較昂貴的層級只在需要時才建立，無頭瀏覽器僅在前兩層失敗時才載入Selenium並啟動，
+    啟動後由之後所有失敗的頻道共用
+    session為調用方傳入的共用會話時，close()不會關閉它；
+    cloudscraper保存與本次執行綁定的Cloudflare驗證狀態，總是由獲取器自行建立
+    """
+
+    def __init__(self, state_file=CLEARANCE_FILE, session=None):
+        self.state_file = state_file
+        self._owns_session = session is None
+        self.session = session or create_session()
+        self.scraper = None
+        self.driver = None
+        self.browser_unavailable = False
+        # 一般HTTP被Cloudflare攔截後，之後的頻道直接使用cloudscraper
+        self.plain_blocked = False
+        self._lock = threading.Lock()
+
+    def _get_scraper(self):
+        with self._lock:
+            if self.scraper is None:
+                self.scraper = create_cloudscraper(self.state_file)
+            return self.scraper
+
+    def fetch_plain(self, url, entry=None):
+        response = self.session.get(url, headers=conditional_headers(entry), timeout=15)
+        if response.status_code in (403, 503):
+            self.plain_blocked = True
+        return to_proglist_response(response)
+
+    def fetch_scraper(self, url, entry=None):
+        scraper = self._get_scraper()
+        # 不覆寫User-Agent，使用與Cloudflare驗證綁定的scraper User-Agent
+        headers = conditional_headers(entry)
+        clearance = current_clearance(scraper)
+        response = scraper.get(url, headers=headers, timeout=15)
+        if response.status_code == 403 and clearance:
+            # 保存的驗證被拒絕，清除後由cloudscraper重新通過驗證
+            if clear_clearance(scraper, self.state_file, rejected=clearance):
+                logger.warning("保存的Cloudflare驗證已被拒絕，重新驗證")
+            response = scraper.get(url, headers=headers, timeout=15)
+        return to_proglist_response(response)
+
+    def fetch(self, url, entry=None):
+        """使用一般HTTP及cloudscraper獲取內容，有驗證資訊時發送條件請求"""
+        if not self.plain_blocked:
+            try:
+                result = self.fetch_plain(url, entry)
+                if result.not_modified or is_json_text(result.text):
+                    return result
+            except Exception as e:
+                logger.debug(f"一般HTTP請求失敗, 改用cloudscraper: {url} {e}")
+        return self.fetch_scraper(url, entry)
+
+    def _start_browser(self):
+        # 延遲載入Selenium，只有真正需要瀏覽器時才付出載入及啟動成本
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument(f"--user-agent={BROWSER_USER_AGENT}")
+        try:
+            return webdriver.Chrome(options=options)
+        except Exception as e:
+            logger.warning(f"無法直接啟動Chrome, 改用webdriver_manager: {e}")
+            from selenium.webdriver.chrome.service import Service
+            from webdriver_manager.chrome import ChromeDriverManager
+            return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+    def fetch_browser(self, url, entry=None):
+        """使用無頭瀏覽器獲取內容，等待Cloudflare驗證頁面完成跳轉，不支援條件請求"""
+        if self.driver is None:
+            if self.browser_unavailable:
+                raise RuntimeError("無頭瀏覽器無法使用")
+            logger.info("啟動無頭瀏覽器")
+            try:
+                self.driver = self._start_browser()
+            except Exception:
+                # 啟動失敗後不再為其他頻道重試
+                self.browser_unavailable = True
+                raise
+
+        self.driver.get(url)
+        deadline = time.time() + BROWSER_TIMEOUT
+        while True:
+            text = self.driver.execute_script("return document.body ? document.body.innerText : ''")
+            if is_json_text(text) or time.time() > deadline:
+                return ProgListResponse(text, None, None, False)
+            time.sleep(1)
+
+    def close(self):
+        if self.scraper is not None and save_clearance(self.scraper, self.state_file):
+            logger.info(f"已保存Cloudflare驗證狀態: {self.state_file}")
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+        if self._owns_session:
+            self.session.close()
+
+def get_4gtv_epg(max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND, jitter=REQUEST_JITTER,
+                 state_file=CLEARANCE_FILE, cache_file=PROGLIST_CACHE_FILE, limiter=None, session=None,
+                 output_dir=OUTPUT_DIR):
+    """
+    並發獲取所有頻道的節目表，返回 (頻道列表, 節目列表)
+    limiter及session可由調用方傳入與其他任務共用的令牌桶及HTTP會話，頻道列表從output_dir/fourgtv.json讀取
+    """
     logger.info("正在獲取 四季線上 電子節目表")
-    channels = get_4gtv_channels()
+    channels = get_4gtv_channels(output_dir)
+    if channels is None:
+        raise RuntimeError(f"無法讀取頻道列表: {os.path.join(output_dir, 'fourgtv.json')}")
     programs = []
+    cache = load_proglist_cache(cache_file)
     
-    # 建立Cloudscraper實例
-    scraper = create_cloudscraper()
+    # 所有工作執行緒共用同一個分層獲取器
+    fetcher = ProgListFetcher(state_file, session)
+    # 所有請求共用的令牌桶，限制請求速率並保留隨機間隔；可由調用方傳入與其他任務共用的令牌桶
+    limiter = limiter or TokenBucket(rate, jitter=jitter)
     
-    for channel in channels:
-        channel_id = channel['channelId']
-        channel_name = channel['channelName']
-        
-        # 添加隨機延遲減少請求頻率
-        delay = random.uniform(1.0, 3.0)
-        logger.debug(f"等待 {delay:.2f} 秒後獲取 {channel_name} 節目表")
-        time.sleep(delay)
+    def fetch(channel):
+        limiter.acquire()
+        return get_4gtv_programs(channel['channelId'], channel['channelName'], fetcher.fetch, cache)
+    
+    try:
+        logger.info(f"並發獲取節目表: {max_workers} 個工作執行緒, 每秒 {rate} 個請求")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch, channels))
         
-        try:
-            channel_programs = get_4gtv_programs_scraper(channel_id, channel_name, scraper)
-            if channel_programs:
-                programs.extend(channel_programs)
-                logger.success(f"成功獲取 {channel_name} 節目表 ({len(channel_programs)} 個節目)")
-            else:
-                logger.warning(f"無法獲取 {channel_name} 節目表")
-        except Exception as e:
-            logger.error(f"獲取 {channel_name} 節目表失敗: {e}")
+        # 前兩層失敗的頻道改用無頭瀏覽器，瀏覽器只啟動一次
+        failed = [index for index, result in enumerate(results) if result is None]
+        if failed:
+            logger.warning(f"{len(failed)} 個頻道無法以一般請求獲取，改用無頭瀏覽器")
+            for index in failed:
+                channel = channels[index]
+                limiter.acquire()
+                results[index] = get_4gtv_programs(channel['channelId'], channel['channelName'], fetcher.fetch_browser, cache)
+    finally:
+        fetcher.close()
+    
+    save_proglist_cache(cache_file, cache, {channel['channelId'] for channel in channels})
+    
+    # 按頻道原始順序合併結果
+    for channel, channel_programs in zip(channels, results):
+        if channel_programs:
+            programs.extend(channel_programs)
+        else:
+            logger.warning(f"無法獲取 {channel['channelName']} 節目表")
     
     return channels, programs
 
-def get_4gtv_channels():
-    local_file = os.path.join(OUTPUT_DIR, 'fourgtv.json')
+def get_4gtv_channels(output_dir=OUTPUT_DIR):
+    local_file = os.path.join(output_dir, 'fourgtv.json')
     if os.path.exists(local_file):
         try:
             logger.info(f"從本地檔案讀取頻道列表: {local_file}")
@@ -100,123 +280,138 @@ def get_4gtv_channels():
         except Exception as e:
             logger.error(f"讀取本地頻道檔案失敗: {e}")
 
-def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
-    """獲取節目表"""
-    url = f"https://www.4gtv.tv/ProgList/{channel_id}.txt"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
-        "Referer": "https://www.4gtv.tv/",
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
-        "Origin": "https://www.4gtv.tv",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin"
-    }
+def is_json_text(text):
+    return bool(text) and text.strip().startswith(('[', '{'))
+
+def load_proglist_cache(cache_file):
+    """讀取節目表驗證資訊及解析結果，檔案不存在或損壞時返回空緩存"""
+    try:
+        data = load_json_cache(cache_file, PROGLIST_CACHE_VERSION)
+        return data.get('channels', {}) if data else {}
+    except Exception as e:
+        logger.warning(f"讀取節目表緩存失敗，將重新獲取: {e}")
+        return {}
+
+def save_proglist_cache(cache_file, cache, channel_ids):
+    """寫入節目表緩存，只保留目前頻道清單中的頻道"""
+    if not cache_file:
+        return
+    channels = {channel_id: entry for channel_id, entry in cache.items() if channel_id in channel_ids}
+    save_json_cache(cache_file, {'channels': channels}, PROGLIST_CACHE_VERSION)
+
+def programs_from_cache(entry, channel_name):
+    return [Programme.from_list(channel_name, item) for item in entry["programs"]]
+
+def programs_to_cache(programs):
+    return [program.to_list() for program in programs]
+
+def get_4gtv_programs(channel_id, channel_name, fetch, cache=None):
+    """
+    使用指定的獲取函數下載並解析節目表，失敗時返回None
+    伺服器返回304或內容雜湊與上次相同時，直接使用緩存的解析結果
+    """
+    url = PROGLIST_URL.format(channel_id=channel_id)
+    entry = cache.get(channel_id) if cache is not None else None
     
     try:
-        response = scraper.get(url, headers=headers, timeout=15)
-        response.encoding = "utf-8"
-        response.raise_for_status()
+        result = fetch(url, entry)
+        
+        if result.not_modified and entry:
+            programs = programs_from_cache(entry, channel_name)
+            logger.success(f"{channel_name} 節目表未變更 (304)，使用緩存 ({len(programs)} 個節目)")
+            return programs
         
         # 檢查是否是有效的JSON
-        if not response.text.strip().startswith(('[', '{')):
+        if not is_json_text(result.text):
             raise ValueError("返回內容不是有效的JSON")
         
-        data = response.json()
-        
-        programs = []
-        tz = pytz.timezone('Asia/Taipei')
-        
-        for item in data:
-            start_time = tz.localize(datetime.strptime(
-                f"{item['sdate']} {item['stime']}", 
-                "%Y-%m-%d %H:%M:%S"
-            ))
-            end_time = tz.localize(datetime.strptime(
-                f"{item['edate']} {item['etime']}", 
-                "%Y-%m-%d %H:%M:%S"
-            ))
-            
-            programs.append({
-                "channelId": channel_id,
-                "channelName": channel_name,
-                "programName": item["title"],
-                "description": item.get("content", ""),
-                "start": start_time,
-                "end": end_time
-            })
+        digest = hashlib.sha256(result.text.encode('utf-8')).hexdigest()
+        if entry and entry.get('hash') == digest:
+            programs = programs_from_cache(entry, channel_name)
+            logger.success(f"{channel_name} 節目表內容未變更，使用緩存 ({len(programs)} 個節目)")
+        else:
+            programs = parse_4gtv_programs(json.loads(result.text), channel_name)
+            logger.success(f"成功獲取 {channel_name} 節目表 ({len(programs)} 個節目)")
         
-        logger.success(f"成功獲取 {channel_name} 節目表 ({len(programs)} 個節目)")
+        if cache is not None:
+            cache[channel_id] = {
+                "etag": result.etag,
+                "last_modified": result.last_modified,
+                "hash": digest,
+                "programs": entry["programs"] if entry and entry.get('hash') == digest else programs_to_cache(programs)
+            }
         return programs
     
     except Exception as e:
-        status_code = response.status_code if 'response' in locals() else 'N/A'
+        status_code = e.response.status_code if getattr(e, 'response', None) is not None else 'N/A'
         logger.error(f"獲取 {channel_name} 節目表失敗. URL: {url} 狀態碼: {status_code} 錯誤: {e}")
         return None
 
+def parse_4gtv_programs(data, channel_name):
+    """解析節目表，節目以頻道名稱分組 (與XML中的頻道id相同)，時間為台灣時間"""
+    programs = []
+    
+    for item in data:
+        programs.append(Programme(
+            channel_name,
+            parse_timestamp(f"{item['sdate']} {item['stime']}", TAIPEI_OFFSET),
+            parse_timestamp(f"{item['edate']} {item['etime']}", TAIPEI_OFFSET),
+            item["title"],
+            item.get("content", "")
+        ))
+    
+    return programs
+
 def generate_xml(channels, programs, filename):
-    tv = ET.Element("tv", attrib={
+    root_attrs = {
         "info-name": "四季線上電子節目表單",
         "info-url": "https://www.4gtv.tv"
-    })
+    }
     
     # 按頻道名稱分組節目
     programs_by_channel = {}
     for program in programs:
-        channel_name = program["channelName"]
-        if channel_name not in programs_by_channel:
-            programs_by_channel[channel_name] = []
-        programs_by_channel[channel_name].append(program)
-    
-    # 添加頻道和節目信息
-    for channel in channels:
-        channel_name = channel["channelName"]
-        
-        # 使用channelName作為id
-        channel_elem = ET.SubElement(tv, "channel", id=channel_name)
-        display_name = ET.SubElement(channel_elem, "display-name", lang="zh")
-        display_name.text = channel_name
-        
-        # 添加頻道描述
-        if channel.get("description"):
-            channel_desc = ET.SubElement(channel_elem, "desc", lang="zh")
-            channel_desc.text = channel["description"]
-        
-        if channel.get("logo"):
-            icon = ET.SubElement(channel_elem, "icon", src=channel["logo"])
-        
-        # 添加該頻道的節目
-        if channel_name in programs_by_channel:
-            # 節目按開始時間排序
-            sorted_programs = sorted(programs_by_channel[channel_name], key=lambda x: x["start"])
+        programs_by_channel.setdefault(program.channel, []).append(program)
+    
+    # 逐個頻道串流寫入XML檔案
+    with XMLTVWriter(filename, root_attrs) as writer:
+        for channel in channels:
+            channel_name = channel["channelName"]
             
-            for program in sorted_programs:
-                try:
-                    # 格式化時區信息 (+0800)
-                    start_str = program["start"].strftime("%Y%m%d%H%M%S %z").replace(" ", "")
-                    end_str = program["end"].strftime("%Y%m%d%H%M%S %z").replace(" ", "")
-                    
-                    programme = ET.SubElement(tv, "programme")
-                    programme.set("channel", channel_name)
-                    programme.set("start", start_str)
-                    programme.set("stop", end_str)
-                    
-                    title = ET.SubElement(programme, "title", lang="zh")
-                    title.text = program["programName"]
-                    
-                    if program.get("description"):
-                        desc = ET.SubElement(programme, "desc", lang="zh")
-                        desc.text = program["description"]
-                except Exception as e:
-                    logger.error(f"生成節目 {program.get('programName', '未知節目')} XML 失敗: {e}")
-    
-    # 生成XML檔案
-    tree = ET.ElementTree(tv)
-    tree.write(filename, encoding="utf-8", xml_declaration=True)
+            # 使用channelName作為id
+            writer.write_channel(
+                channel_name,
+                channel_name,
+                lang="zh",
+                icon=channel.get("logo"),
+                desc=channel.get("description")
+            )
+            
+            # 添加該頻道的節目
+            if channel_name in programs_by_channel:
+                # 節目按開始時間排序
+                sorted_programs = sorted(programs_by_channel[channel_name], key=lambda x: x.start)
+                
+                for program in sorted_programs:
+                    # 時間與時區之間不加空格 (20250101080000+0800)
+                    writer.write_programme(
+                        channel_name,
+                        program.xmltv_start(sep=''),
+                        program.xmltv_stop(sep=''),
+                        program.title,
+                        desc=program.desc
+                    )
+    
     logger.info(f"電子節目表單已生成: {filename}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='四季線上電子節目表單')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help=f'同時進行的請求數 (默認: {MAX_WORKERS})')
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help=f'每秒請求數上限 (默認: {REQUESTS_PER_SECOND})')
+    parser.add_argument('--no-cache', action='store_true', help='不使用節目表緩存，重新下載並解析所有頻道')
+    parser.add_argument('--jitter', type=float, default=REQUEST_JITTER, help=f'每個請求的隨機延遲上限(秒) (默認: {REQUEST_JITTER})')
+    args = parser.parse_args()
+    
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     log_file = os.path.join(OUTPUT_DIR, 'epg_generator.log')
@@ -234,7 +429,10 @@ if __name__ == "__main__":
         logger.info(f"開始時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info(f"輸出目錄: {OUTPUT_DIR}")
         
-        channels, programs = get_4gtv_epg()
+        channels, programs = get_4gtv_epg(
+            args.workers, args.rate, args.jitter,
+            cache_file=None if args.no_cache else PROGLIST_CACHE_FILE
+        )
         logger.info(f"共獲取 {len(channels)} 個頻道, {len(programs)} 個節目")
         
         # 設置XML輸出路徑
@@ -1,23 +1,8 @@
-import requests
+import argparse
 import json
-import time
 import os
 from pathlib import Path
-
-def get_channel_data(channel_id):
-    """獲取頻道資料"""
-    url = f"https://www.ofiii.com/_next/data/464M-DArabIf4rNleEdJm/channel/watch/{channel_id}.json"
-    
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"❌ 獲取頻道 {channel_id} 資料失敗: {e}")
-        return None
+from ofiii_client import CRAWL_RATE, OfiiiClient, iter_channel_pages
 
 def get_display_name(title, subtitle):
     """根據標題和副標題生成顯示名稱"""
@@ -114,7 +99,7 @@ def get_channel_info(channel_data, channel_id):
 
 def ensure_output_dir():
     """確保輸出目錄存在"""
-    output_dir = Path('../output')
+    output_dir = Path(__file__).resolve().parent.parent / 'output'
     output_dir.mkdir(exist_ok=True)
     return output_dir
 
@@ -152,126 +137,167 @@ def generate_playout_channel_json(channel_ids):
     
     return playout_data
 
-def main():
-    # 確保輸出目錄存在
-    output_dir = ensure_output_dir()
-    m3u_file = output_dir / 'ofiii.m3u'
-    channel_json_file = output_dir / 'ofiii_channel.json'
-    playout_channel_json_file = output_dir / 'ofiii_playout-channel.json'
-    
-    # 頻道ID列表
-    channel_ids = [
-        "ofiii13","ofiii16","ofiii22","ofiii23","ofiii24","ofiii31","ofiii32",
-        "ofiii36","ofiii38","ofiii39","ofiii1048","ofiii50","ofiii55","ofiii64","ofiii70",
-        "ofiii73","ofiii74","ofiii75","ofiii76","ofiii81","ofiii82","ofiii83","ofiii85",
-        "ofiii88","ofiii89","ofiii91","ofiii92","ofiii94","ofiii95","ofiii96","ofiii97",
-        "ofiii99","ofiii100","ofiii101","ofiii102","ofiii103","ofiii104","ofiii105",
-        "ofiii106","ofiii107","ofiii108","ofiii109","ofiii110","ofiii111","ofiii112",
-        "ofiii113","ofiii114","ofiii115","ofiii116","ofiii117","ofiii118","ofiii119",
-        "ofiii120","ofiii121","ofiii122","ofiii123","ofiii124","ofiii125","ofiii126",
-        "ofiii127","ofiii128","ofiii129","ofiii131","ofiii132","ofiii133","ofiii134",
-        "ofiii135","ofiii136","ofiii137","ofiii139","ofiii140","ofiii141","ofiii142",
-        "ofiii143","ofiii144","ofiii145","ofiii146","ofiii147","ofiii148","ofiii150",
-        "ofiii151","ofiii152","ofiii153","ofiii154","ofiii155","ofiii156","ofiii157",
-        "ofiii158","ofiii159","ofiii160","ofiii161","ofiii162","ofiii163","ofiii164",
-        "ofiii165","ofiii166","ofiii167","ofiii168","ofiii169","ofiii170","ofiii171",
-        "ofiii172","ofiii173","ofiii174","ofiii175","ofiii177","ofiii178","ofiii179",
-        "ofiii180","ofiii182","ofiii183","ofiii184","ofiii185","ofiii186","ofiii187",
-        "ofiii192","ofiii195","ofiii196","ofiii198","ofiii200","ofiii201","ofiii202",
-        "ofiii203","ofiii204","ofiii205","ofiii206","ofiii207","ofiii208","ofiii209",
-        "ofiii210","ofiii211","ofiii212","ofiii215","ofiii216","ofiii217","ofiii218",
-        "ofiii225","ofiii226","ofiii227","ofiii228","ofiii234","ofiii235","ofiii236",
-        "ofiii237","ofiii238","ofiii239","ofiii240","ofiii241","ofiii242","ofiii243",
-        "ofiii244","ofiii245","ofiii246","ofiii247","ofiii248","ofiii250","ofiii251",
-        "ofiii252","ofiii254","ofiii255"
-    ]
-    
-    # M3U文件頭
-    m3u_content = ['#EXTM3U x-tvg-url=""']
-    channel_data = {}
-    
-    # 用於追蹤已使用的asset_id
-    asset_seen = set()
-    
-    print("🚀 開始獲取頻道資料...")
-    successful_channels = 0
-    failed_channels = 0
-    skipped_channels = 0
-    total_programs = 0
-    total_duplicate_assets = 0
-    
-    # 遍歷所有頻道ID
-    for i, channel_id in enumerate(channel_ids, 1):
-        print(f"\n📋 處理頻道 {i}/{len(channel_ids)}: {channel_id}")
+# 頻道ID列表
+CHANNEL_IDS = [
+    "ofiii13","ofiii16","ofiii22","ofiii23","ofiii24","ofiii31","ofiii32",
+    "ofiii36","ofiii38","ofiii39","ofiii1048","ofiii50","ofiii55","ofiii64","ofiii70",
+    "ofiii73","ofiii74","ofiii75","ofiii76","ofiii81","ofiii82","ofiii83","ofiii85",
+    "ofiii88","ofiii89","ofiii91","ofiii92","ofiii94","ofiii95","ofiii96","ofiii97",
+    "ofiii99","ofiii100","ofiii101","ofiii102","ofiii103","ofiii104","ofiii105",
+    "ofiii106","ofiii107","ofiii108","ofiii109","ofiii110","ofiii111","ofiii112",
+    "ofiii113","ofiii114","ofiii115","ofiii116","ofiii117","ofiii118","ofiii119",
+    "ofiii120","ofiii121","ofiii122","ofiii123","ofiii124","ofiii125","ofiii126",
+    "ofiii127","ofiii128","ofiii129","ofiii131","ofiii132","ofiii133","ofiii134",
+    "ofiii135","ofiii136","ofiii137","ofiii139","ofiii140","ofiii141","ofiii142",
+    "ofiii143","ofiii144","ofiii145","ofiii146","ofiii147","ofiii148","ofiii150",
+    "ofiii151","ofiii152","ofiii153","ofiii154","ofiii155","ofiii156","ofiii157",
+    "ofiii158","ofiii159","ofiii160","ofiii161","ofiii162","ofiii163","ofiii164",
+    "ofiii165","ofiii166","ofiii167","ofiii168","ofiii169","ofiii170","ofiii171",
+    "ofiii172","ofiii173","ofiii174","ofiii175","ofiii177","ofiii178","ofiii179",
+    "ofiii180","ofiii182","ofiii183","ofiii184","ofiii185","ofiii186","ofiii187",
+    "ofiii192","ofiii195","ofiii196","ofiii198","ofiii200","ofiii201","ofiii202",
+    "ofiii203","ofiii204","ofiii205","ofiii206","ofiii207","ofiii208","ofiii209",
+    "ofiii210","ofiii211","ofiii212","ofiii215","ofiii216","ofiii217","ofiii218",
+    "ofiii225","ofiii226","ofiii227","ofiii228","ofiii234","ofiii235","ofiii236",
+    "ofiii237","ofiii238","ofiii239","ofiii240","ofiii241","ofiii242","ofiii243",
+    "ofiii244","ofiii245","ofiii246","ofiii247","ofiii248","ofiii250","ofiii251",
+    "ofiii252","ofiii254","ofiii255"
+]
+
+def get_channel_ids():
+    """返回需要生成M3U的頻道ID列表"""
+    return list(CHANNEL_IDS)
+
+class OfiiiM3UBuilder:
+    """
+    逐個頻道接收頁面資料並累積M3U及頻道JSON內容
+    頁面資料可來自本腳本自行獲取，也可與ofiii_epg共用同一次抓取結果
+    """
+
+    def __init__(self, channel_ids):
+        self.channel_ids = channel_ids
+        self._wanted = set(channel_ids)
+        # M3U文件頭
+        self.m3u_content = ['#EXTM3U x-tvg-url=""']
+        self.channel_data = {}
+        # 用於追蹤已使用的asset_id
+        self.asset_seen = set()
+        self.processed = 0
+        self.successful_channels = 0
+        self.failed_channels = 0
+        self.skipped_channels = 0
+        self.total_programs = 0
+        self.total_duplicate_assets = 0
+
+    def add(self, channel_id, page_props):
+        """處理一個頻道的pageProps，page_props為None表示獲取失敗，不在頻道列表中的頻道會被忽略"""
+        if channel_id not in self._wanted:
+            return
+        self.processed += 1
+        print(f"\n📋 處理頻道 {self.processed}/{len(self.channel_ids)}: {channel_id}")
         
-        # 獲取頻道資料
-        channel_json = get_channel_data(channel_id)
+        if page_props is None:
+            self.failed_channels += 1
+            return
         
-        if channel_json:
-            # 獲取頻道基本資訊
-            channel_info = get_channel_info(channel_json, channel_id)
-            
-            if channel_info:
-                # 添加到channel.json資料
-                channel_data[channel_id] = [
-                    channel_info['name'],
-                    channel_info['picture'],
-                    channel_info['group_title']
-                ]
-            
-            # 生成M3U內容
-            channel_lines, added_programs, duplicate_assets = generate_m3u_content(channel_json, channel_id, asset_seen)
-            total_duplicate_assets += duplicate_assets
+        channel_json = {'pageProps': page_props}
+        
+        # 獲取頻道基本資訊
+        channel_info = get_channel_info(channel_json, channel_id)
+        
+        if channel_info:
+            # 添加到channel.json資料
+            self.channel_data[channel_id] = [
+                channel_info['name'],
+                channel_info['picture'],
+                channel_info['group_title']
+            ]
+        
+        # 生成M3U內容
+        channel_lines, added_programs, duplicate_assets = generate_m3u_content(channel_json, channel_id, self.asset_seen)
+        self.total_duplicate_assets += duplicate_assets
+        
+        if channel_lines:
+            self.m3u_content.extend(channel_lines)
+            self.successful_channels += 1
+            self.total_programs += added_programs
             
-            if channel_lines:
-                m3u_content.extend(channel_lines)
-                successful_channels += 1
-                total_programs += added_programs
-                
-                if duplicate_assets > 0:
-                    print(f"✅ 成功添加頻道 {channel_id} ({added_programs} 個節目, 跳過 {duplicate_assets} 個重複asset_id)")
-                else:
-                    print(f"✅ 成功添加頻道 {channel_id} ({added_programs} 個節目)")
+            if duplicate_assets > 0:
+                print(f"✅ 成功添加頻道 {channel_id} ({added_programs} 個節目, 跳過 {duplicate_assets} 個重複asset_id)")
             else:
-                skipped_channels += 1
+                print(f"✅ 成功添加頻道 {channel_id} ({added_programs} 個節目)")
         else:
-            failed_channels += 1
+            self.skipped_channels += 1
+
+    def write(self, output_dir):
+        """寫入ofiii.m3u、ofiii_channel.json及ofiii_playout-channel.json"""
+        output_dir = Path(output_dir)
+        m3u_file = output_dir / 'ofiii.m3u'
+        channel_json_file = output_dir / 'ofiii_channel.json'
+        playout_channel_json_file = output_dir / 'ofiii_playout-channel.json'
         
-        # 添加延遲避免請求過快
-        time.sleep(0.5)
-    
-    # 去除重複的頻道資料
-    print("\n🔄 檢查並移除重複頻道...")
-    unique_channel_data = remove_duplicate_channels(channel_data)
-    
-    # 生成ofiii_playout-channel.json
-    print("\n🔄 生成ofiii_playout-channel.json...")
-    playout_channel_data = generate_playout_channel_json(channel_ids)
+        # 去除重複的頻道資料
+        print("\n🔄 檢查並移除重複頻道...")
+        unique_channel_data = remove_duplicate_channels(self.channel_data)
+        
+        # 生成ofiii_playout-channel.json
+        print("\n🔄 生成ofiii_playout-channel.json...")
+        playout_channel_data = generate_playout_channel_json(self.channel_ids)
+        
+        # 寫入M3U文件
+        with open(m3u_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.m3u_content))
+        
+        # 寫入channel.json文件
+        with open(channel_json_file, 'w', encoding='utf-8') as f:
+            json.dump(unique_channel_data, f, ensure_ascii=False, indent=2)
+        
+        # 寫入ofiii_playout-channel.json文件
+        with open(playout_channel_json_file, 'w', encoding='utf-8') as f:
+            json.dump(playout_channel_data, f, ensure_ascii=False, indent=2)
+        
+        print(f"\n🎉 檔案生成完成！")
+        print(f"📊 統計資訊:")
+        print(f"   ✅ 成功處理: {self.successful_channels} 個頻道")
+        print(f"   ⚠️  跳過處理: {self.skipped_channels} 個頻道 (無節目)")
+        print(f"   ❌ 處理失敗: {self.failed_channels} 個頻道")
+        print(f"   📺 總節目數: {self.total_programs} 個節目")
+        print(f"   🔄 唯一頻道數: {len(unique_channel_data)} 個頻道")
+        print(f"   🔄 跳過重複asset_id: {self.total_duplicate_assets} 個")
+        print(f"   📁 輸出檔案:")
+        print(f"      - {m3u_file}")
+        print(f"      - {channel_json_file}")
+        print(f"      - {playout_channel_json_file}")
+
+def main():
+    parser = argparse.ArgumentParser(description='生成ofiii M3U播放清單及頻道資料')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='並行抓取的執行緒數，1表示逐個抓取 (默認: 4)')
+    parser.add_argument('--rate', type=float, default=CRAWL_RATE,
+                        help=f'並行抓取時平均每秒請求數 (默認: {CRAWL_RATE})')
+    parser.add_argument('--verify', choices=['drop', 'tag'],
+                        help='生成後並行驗證每個條目 (需先啟動ofiii_play_server)，移除(drop)或標記(tag)無法播放的條目')
+    args = parser.parse_args()
     
-    # 寫入M3U文件
-    with open(m3u_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(m3u_content))
+    # 確保輸出目錄存在
+    output_dir = ensure_output_dir()
+    channel_ids = get_channel_ids()
+    builder = OfiiiM3UBuilder(channel_ids)
+    client = OfiiiClient(pool_size=max(args.workers, 1))
     
-    # 寫入channel.json文件
-    with open(channel_json_file, 'w', encoding='utf-8') as f:
-        json.dump(unique_channel_data, f, ensure_ascii=False, indent=2)
+    print("🚀 開始獲取頻道資料...")
+    for channel_id, page_props in iter_channel_pages(channel_ids, client, workers=args.workers, rate=args.rate):
+        builder.add(channel_id, page_props)
     
-    # 寫入ofiii_playout-channel.json文件
-    with open(playout_channel_json_file, 'w', encoding='utf-8') as f:
-        json.dump(playout_channel_data, f, ensure_ascii=False, indent=2)
+    builder.write(output_dir)
     
-    print(f"\n🎉 檔案生成完成！")
-    print(f"📊 統計資訊:")
-    print(f"   ✅ 成功處理: {successful_channels} 個頻道")
-    print(f"   ⚠️  跳過處理: {skipped_channels} 個頻道 (無節目)")
-    print(f"   ❌ 處理失敗: {failed_channels} 個頻道")
-    print(f"   📺 總節目數: {total_programs} 個節目")
-    print(f"   🔄 唯一頻道數: {len(unique_channel_data)} 個頻道")
-    print(f"   🔄 跳過重複asset_id: {total_duplicate_assets} 個")
-    print(f"   📁 輸出檔案:")
-    print(f"      - {m3u_file}")
-    print(f"      - {channel_json_file}")
-    print(f"      - {playout_channel_json_file}")
+    if args.verify:
+        from hls_probe import verify_playlist
+        # 播放清單已寫入，驗證失敗時保留未驗證的播放清單
+        try:
+            verify_playlist(os.path.join(output_dir, 'ofiii.m3u'), args.verify, os.path.join(output_dir, 'ofiii_health.json'))
+        except Exception as e:
+            print(f"⚠️ 驗證播放清單失敗，保留未驗證的播放清單: {e}")
 
 if __name__ == "__main__":
     main()
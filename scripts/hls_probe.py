@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+# 同時進行的探測總數及每個主機的上限
+MAX_CONCURRENCY = 50
+MAX_PER_HOST = 8
+# 單個頻道探測（播放清單加第一個分片）的超時時間（秒）
+PROBE_TIMEOUT = 10
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+# 標記失效條目時加入#EXTINF的屬性
+DEAD_ATTR = 'tvg-health="dead"'
+
+BANDWIDTH_PATTERN = re.compile(r'[:,]BANDWIDTH=(\d+)')
+
+
+def parse_m3u(text):
+    """解析M3U播放清單，返回 (檔頭行列表, [(#EXTINF等標籤行列表, URL)])"""
+    header = []
+    entries = []
+    tags = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith('#EXTM3U'):
+            header.append(line)
+        elif line.startswith('#'):
+            tags.append(line)
+        else:
+            entries.append((tags, line.strip()))
+            tags = []
+    return header, entries
+
+
+def entry_name(tags):
+    """從#EXTINF行取出頻道顯示名稱"""
+    for tag in tags:
+        if tag.startswith('#EXTINF'):
+            return tag.rsplit(',', 1)[-1].strip()
+    return ''
+
+
+def resolve_uri(base_url, uri):
+    """將播放清單中的URI轉為絕對地址，URI沒有查詢參數時沿用播放清單的令牌參數"""
+    url = urljoin(base_url, uri)
+    query = urlparse(base_url).query
+    if query and not urlparse(url).query:
+        url += '?' + query
+    return url
+
+
+def first_uri(text, base_url):
+    """
+    返回 (是否為主播放清單, URI)
+    主播放清單返回BANDWIDTH最高的變體，媒體播放清單返回第一個分片
+    """
+    variants = []
+    bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            match = BANDWIDTH_PATTERN.search(line)
+            bandwidth = int(match.group(1)) if match else 0
+        elif line and not line.startswith('#'):
+            if bandwidth is None:
+                return False, resolve_uri(base_url, line)
+            variants.append((bandwidth, resolve_uri(base_url, line)))
+            bandwidth = None
+    if variants:
+        return True, max(variants)[1]
+    return False, None
+
+
+async def probe_stream(session, url):
+    """
+    探測一個HLS地址：下載播放清單（主播放清單時再下載最高碼率的變體），
+    再以HEAD確認第一個分片可用，返回 (是否可用, 錯誤信息)
+    """
+    for _ in range(2):
+        async with session.get(url) as response:
+            if response.status != 200:
+                return False, f"播放清單HTTP {response.status}"
+            text = await response.text()
+            base_url = str(response.url)
+        if not text.lstrip().startswith('#EXTM3U'):
+            return False, "不是HLS播放清單"
+        is_master, url = first_uri(text, base_url)
+        if not url:
+            return False, "播放清單中沒有分片"
+        if not is_master:
+            break
+    else:
+        return False, "變體仍是主播放清單"
+
+    async with session.head(url, allow_redirects=True) as response:
+        if response.status == 200:
+            return True, None
+    # 部分CDN不接受HEAD，改用只取第一個位元組的Range請求
+    async with session.get(url, headers={'Range': 'bytes=0-0'}) as response:
+        if response.status in (200, 206):
+            return True, None
+        return False, f"分片HTTP {response.status}"
+
+
+async def probe_all(urls, concurrency=MAX_CONCURRENCY, per_host=MAX_PER_HOST, timeout=PROBE_TIMEOUT):
+    """
+    並行探測所有地址，返回與urls順序相同的 (是否可用, 延遲毫秒, 錯誤信息) 列表
+    以信號量限制總數及每個主機的同時探測數，取得名額後才開始計時，排隊時間不計入超時
+    單個條目的任何錯誤（無效地址、無法解碼的播放清單等）只將該條目記為失效，不影響其他條目
+    """
+    limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
+        async def probe(url):
+            try:
+                host = urlparse(url).netloc
+            except ValueError as e:
+                return False, 0, f"無效地址: {e}"
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+            async with host_limit, limit:
+                start = time.perf_counter()
+                try:
+                    ok, error = await asyncio.wait_for(probe_stream(session, url), timeout)
+                except asyncio.TimeoutError:
+                    ok, error = False, "超時"
+                except Exception as e:
+                    ok, error = False, str(e) or type(e).__name__
+                return ok, round((time.perf_counter() - start) * 1000), error
+
+        return await asyncio.gather(*(probe(url) for url in urls))
+
+
+def verify_playlist(m3u_file, mode='drop', report_file=None, concurrency=MAX_CONCURRENCY,
+                    per_host=MAX_PER_HOST, timeout=PROBE_TIMEOUT):
+    """
+    驗證播放清單中每個條目是否可以播放，並原子更新播放清單
+    @params:
+        m3u_file    - 播放清單路徑 (Str)
+        mode        - drop: 移除失效條目；tag: 保留並在#EXTINF加入tvg-health="dead" (Str)
+        report_file - 每個條目的延遲及健康狀況報告(JSON)路徑，None表示不寫 (Str)
+    返回 (可用條目數, 失效條目數)
+    """
+    with open(m3u_file, 'r', encoding='utf-8') as f:
+        header, entries = parse_m3u(f.read())
+
+    start = time.perf_counter()
+    # 相同地址只探測一次
+    unique_urls = list(dict.fromkeys(url for _, url in entries))
+    results = dict(zip(unique_urls, asyncio.run(probe_all(unique_urls, concurrency, per_host, timeout))))
+    elapsed = time.perf_counter() - start
+
+    lines = list(header) or ['#EXTM3U']
+    report = []
+    alive = dead = 0
+    for tags, url in entries:
+        ok, latency, error = results[url]
+        report.append({"name": entry_name(tags), "url": url, "ok": ok, "latency_ms": latency, "error": error})
+        if ok:
+            alive += 1
+        else:
+            dead += 1
+            if mode == 'drop':
+                continue
+            tags = [tag.replace('#EXTINF:-1 ', f'#EXTINF:-1 {DEAD_ATTR} ', 1) for tag in tags]
+        lines.extend(tags)
+        lines.append(url)
+
+    tmp_file = m3u_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_file, m3u_file)
+
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"🩺 驗證 {len(entries)} 個條目 ({len(unique_urls)} 個地址)，耗時 {elapsed:.1f}秒: "
+          f"可用 {alive} 個，失效 {dead} 個 ({'已移除' if mode == 'drop' else '已標記'})")
+    return alive, dead
+
+
+def main():
+    parser = argparse.ArgumentParser(description='並行驗證M3U播放清單中的HLS地址')
+    parser.add_argument('m3u_file', help='播放清單路徑')
+    parser.add_argument('--mode', choices=['drop', 'tag'], default='drop', help='失效條目的處理方式 (默認: drop)')
+    parser.add_argument('--report', help='健康狀況報告(JSON)路徑')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help=f'同時探測數 (默認: {MAX_CONCURRENCY})')
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help=f'每個主機的同時探測數 (默認: {MAX_PER_HOST})')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help=f'每個條目的超時時間(秒) (默認: {PROBE_TIMEOUT})')
+    args = parser.parse_args()
+    verify_playlist(args.m3u_file, args.mode, args.report, args.concurrency, args.per_host, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import json
+import os
+
+
+def load_json_cache(path, version=None):
+    """
+    讀取JSON緩存檔案
+    檔案不存在、內容不是物件或版本不符時返回None；檔案無法讀取或JSON無效時拋出OSError/ValueError，
+    由呼叫者決定是否記錄警告
+    @params:
+        path    - 緩存檔案路徑，None表示停用緩存 (Str)
+        version - 要求的'version'欄位，None表示不檢查 (Int)
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        return None
+    if version is not None and data.get('version') != version:
+        return None
+    return data
+
+
+def save_json_cache(path, data, version=None, **dump_kwargs):
+    """
+    原子寫入JSON緩存檔案：先寫入暫存檔再替換，寫入中途失敗不會損壞原有檔案
+    @params:
+        path        - 緩存檔案路徑，None時不寫入 (Str)
+        data        - 要寫入的物件 (Dict)
+        version     - 寫入的'version'欄位，None表示不加入 (Int)
+        dump_kwargs - 傳給json.dump的其他參數，例如indent (Dict)
+    """
+    if not path:
+        return
+    if version is not None:
+        data = dict(data, version=version)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp_file, path)
@@ -0,0 +1,274 @@
+import argparse
+import math
+import os
+import re
+import sys
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+
+from programme import Programme, format_xmltv_time, parse_xmltv_time
+from xmltv_writer import XMLTVWriter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+# 各提供者的輸出，按優先順序排列：排在前面的節目表在覆蓋範圍相近時優先採用
+DEFAULT_INPUTS = [os.path.join(OUTPUT_DIR, name) for name in ('4g.xml', 'litv.xml', 'hami.xml', 'ofiii.xml')]
+DEFAULT_OUTPUT = os.path.join(OUTPUT_DIR, 'epg.xml')
+
+# 覆蓋時間不少於最佳節目表的此比例時，按優先順序選擇主節目表
+PRIMARY_COVERAGE_RATIO = 0.9
+# 其他節目表的節目可超出空檔邊界的秒數，超出部分會被裁掉
+FILL_TOLERANCE = 300
+# 裁剪後短於此秒數的節目會被丟棄
+MIN_DURATION = 60
+
+# 無法以規則統一的頻道名稱，鍵及值都是normalize_channel_name後的結果
+CHANNEL_ALIASES = {
+    '國會頻道1': '國會頻道1台',
+    '國會頻道2': '國會頻道2台',
+}
+
+# 名稱中的附註，例如 台視《11/26即將下架》
+ANNOTATION_PATTERN = re.compile(r'《[^》]*》|【[^】]*】')
+CHINESE_NUMERALS = str.maketrans('一二三四五六七八九', '123456789')
+NUMBERED_PATTERN = re.compile(r'([一二三四五六七八九])台')
+
+
+def normalize_channel_name(name):
+    """
+    將不同提供者的頻道名稱統一為比對用的鍵
+    全形轉半形、忽略大小寫及空白、臺轉台、移除附註及HD後綴、一台轉1台
+    """
+    name = unicodedata.normalize('NFKC', name or '')
+    name = ANNOTATION_PATTERN.sub('', name)
+    name = NUMBERED_PATTERN.sub(lambda m: m.group(1).translate(CHINESE_NUMERALS) + '台', name)
+    name = re.sub(r'\s+', '', name).lower().replace('臺', '台')
+    if name.endswith('hd') and len(name) > 2:
+        name = name[:-2]
+    return CHANNEL_ALIASES.get(name, name)
+
+
+class MergedChannel:
+    """合併後的頻道：各提供者的名稱、圖示、簡介及節目表"""
+
+    def __init__(self, name):
+        self.id = ANNOTATION_PATTERN.sub('', name).strip() or name
+        self.names = []
+        self.icon = None
+        self.desc = None
+        self.schedules = {}
+
+    def add_info(self, names, icon, desc):
+        self.names.extend(name for name in names if name not in self.names)
+        self.icon = self.icon or icon
+        self.desc = self.desc or desc
+
+
+def child_text(elem, tag):
+    child = elem.find(tag)
+    return child.text.strip() if child is not None and child.text else ''
+
+
+def read_guide(path):
+    """
+    以iterparse串流讀取XMLTV檔案，處理完每個元素後即清除，記憶體用量不隨檔案大小增長
+    返回 (頻道列表 [(頻道id, 名稱列表, 圖示, 簡介)], {頻道id: [Programme]})
+    """
+    channels = []
+    programmes = {}
+    root = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end':
+            continue
+        if elem.tag == 'channel':
+            icon = elem.find('icon')
+            names = [name.text.strip() for name in elem.findall('display-name') if name.text and name.text.strip()]
+            channels.append((elem.get('id'), names or [elem.get('id')],
+                             icon.get('src') if icon is not None else None, child_text(elem, 'desc')))
+            root.clear()
+        elif elem.tag == 'programme':
+            try:
+                start, offset = parse_xmltv_time(elem.get('start', ''))
+                stop, _ = parse_xmltv_time(elem.get('stop', ''))
+            except ValueError:
+                root.clear()
+                continue
+            channel_id = elem.get('channel')
+            if stop > start:
+                programmes.setdefault(channel_id, []).append(Programme(
+                    channel_id, start, stop, child_text(elem, 'title'),
+                    child_text(elem, 'desc'), child_text(elem, 'sub-title'), offset
+                ))
+            root.clear()
+    return channels, programmes
+
+
+def dedupe_schedule(programmes):
+    """
+    整理單一提供者的節目表：按開始時間排序後掃描一次，
+    相同開始時間只保留第一個，前一個節目與下一個重疊時提前結束於下一個的開始時間
+    """
+    schedule = []
+    for programme in sorted(programmes, key=lambda p: p.start):
+        if schedule:
+            previous = schedule[-1]
+            if programme.start == previous.start:
+                continue
+            if programme.start < previous.stop:
+                previous.stop = programme.start
+                if previous.stop - previous.start < MIN_DURATION:
+                    schedule.pop()
+        schedule.append(programme)
+    return schedule
+
+
+def coverage(schedule, since):
+    """節目表在since之後覆蓋的秒數"""
+    return sum(max(0, p.stop - max(p.start, since)) for p in schedule)
+
+
+def find_gaps(schedule):
+    """返回節目表中未覆蓋的時段，包括第一個節目之前及最後一個節目之後"""
+    gaps = []
+    previous_stop = -math.inf
+    for programme in schedule:
+        if programme.start > previous_stop:
+            gaps.append((previous_stop, programme.start))
+        previous_stop = max(previous_stop, programme.stop)
+    gaps.append((previous_stop, math.inf))
+    return gaps
+
+
+def fill_gaps(schedule, candidates, tolerance=FILL_TOLERANCE):
+    """
+    以另一個提供者的節目填補主節目表的空檔
+    兩個節目表都已排序且不重疊，空檔與候選節目各掃描一次；
+    候選節目必須落在空檔內（容許tolerance秒的誤差，超出部分裁掉），與主節目表重疊的節目不採用
+    """
+    gaps = find_gaps(schedule)
+    filled = []
+    index = 0
+    for programme in candidates:
+        while index < len(gaps) and gaps[index][1] <= programme.start:
+            index += 1
+        if index == len(gaps):
+            break
+        gap_start, gap_end = gaps[index]
+        if programme.start < gap_start - tolerance or programme.stop > gap_end + tolerance:
+            continue
+        start, stop = max(programme.start, gap_start), min(programme.stop, gap_end)
+        if stop - start >= MIN_DURATION:
+            filled.append(Programme(programme.channel, start, stop, programme.title,
+                                    programme.desc, programme.sub_title, programme.offset))
+    if not filled:
+        return schedule
+    return sorted(schedule + filled, key=lambda p: p.start)
+
+
+def merge_schedules(schedules, since):
+    """
+    合併同一頻道在各提供者的節目表，schedules為按優先順序排列的 [(提供者, 節目表)]
+    覆蓋時間最長（或與最長相差不到PRIMARY_COVERAGE_RATIO）且優先順序最高的節目表作為主節目表，
+    其餘節目表按優先順序填補主節目表的空檔
+    返回 (主節目表的提供者, 合併後的節目表)
+    """
+    schedules = [(source, dedupe_schedule(programmes)) for source, programmes in schedules]
+    covered = [coverage(schedule, since) for _, schedule in schedules]
+    threshold = max(covered) * PRIMARY_COVERAGE_RATIO
+    primary = next(index for index, value in enumerate(covered) if value >= threshold)
+
+    source, merged = schedules[primary]
+    for index, (_, schedule) in enumerate(schedules):
+        if index != primary:
+            merged = fill_gaps(merged, schedule)
+    return source, merged
+
+
+def merge_guides(inputs, output_file, since=None):
+    """
+    讀取各提供者的XMLTV檔案，按頻道名稱對應後合併為一個節目表
+    @params:
+        inputs      - 按優先順序排列的XMLTV檔案路徑，不存在或無法解析的檔案會被略過 (List)
+        output_file - 合併後的XMLTV檔案路徑 (Str)
+        since       - 計算覆蓋時間的起點epoch秒數，默認為現在 (Int)
+    返回合併後的頻道數，沒有任何可用輸入時不覆蓋原有檔案並返回0
+    """
+    since = int(time.time()) if since is None else since
+    channels = {}
+    sources = []
+
+    for path in inputs:
+        source = os.path.splitext(os.path.basename(path))[0]
+        if not os.path.exists(path):
+            print(f"⚠️ 略過不存在的節目表: {path}")
+            continue
+        start = time.perf_counter()
+        try:
+            source_channels, programmes = read_guide(path)
+        except ET.ParseError as e:
+            print(f"⚠️ 略過無法解析的節目表: {path}, {e}")
+            continue
+        sources.append(source)
+
+        keys = {}
+        for channel_id, names, icon, desc in source_channels:
+            key = normalize_channel_name(names[0])
+            keys[channel_id] = key
+            channel = channels.setdefault(key, MergedChannel(names[0]))
+            channel.add_info(names, icon, desc)
+        for channel_id, channel_programmes in programmes.items():
+            key = keys.get(channel_id) or normalize_channel_name(channel_id)
+            channel = channels.setdefault(key, MergedChannel(channel_id))
+            channel.schedules.setdefault(source, []).extend(channel_programmes)
+        print(f"📖 讀取 {source}: {len(source_channels)} 個頻道, "
+              f"{sum(len(p) for p in programmes.values())} 個節目, 耗時 {time.perf_counter() - start:.2f}秒")
+
+    if not sources:
+        print("❌ 沒有可合併的節目表")
+        return 0
+
+    root_attrs = {"generator-info-name": "EPG-Merger", "source-info-name": ", ".join(sources)}
+    primary_counts = {}
+    with XMLTVWriter(output_file, root_attrs, spool=True) as writer:
+        for channel in channels.values():
+            # 保留各提供者的名稱，讓播放清單中任一名稱都能對應到頻道
+            writer.write_channel(channel.id, channel.names, lang='zh', icon=channel.icon, desc=channel.desc)
+
+            if not channel.schedules:
+                continue
+            source, schedule = merge_schedules(
+                [(name, channel.schedules[name]) for name in sources if name in channel.schedules], since)
+            primary_counts[source] = primary_counts.get(source, 0) + 1
+            for programme in schedule:
+                writer.write_programme(
+                    channel.id,
+                    format_xmltv_time(programme.start, programme.offset),
+                    format_xmltv_time(programme.stop, programme.offset),
+                    programme.title,
+                    sub_title=programme.sub_title,
+                    desc=programme.desc
+                )
+
+    print(f"✅ 合併節目表已生成: {output_file}")
+    print(f"📺 頻道數: {writer.channel_count}, 節目數: {writer.programme_count}")
+    print(f"📊 主節目表來源: {', '.join(f'{name} {count}' for name, count in primary_counts.items())}")
+    print(f"💾 檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
+    return writer.channel_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合併各提供者的電視節目表')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS,
+                        help='按優先順序排列的XMLTV檔案 (默認: output/4g.xml litv.xml hami.xml ofiii.xml)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='輸出檔案路徑 (默認: output/epg.xml)')
+    args = parser.parse_args()
+
+    if not merge_guides(args.inputs, args.output):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from json_cache import load_json_cache, save_json_cache
+from rate_limiter import TokenBucket
+
+BASE_URL = "https://www.ofiii.com"
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+REQUEST_TIMEOUT = 30
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 保存已發現的Next.js buildId，在有效期內重用
+BUILD_ID_CACHE_FILE = os.path.join(BASE_DIR, 'cache', 'ofiii_build_id.json')
+BUILD_ID_TTL = 6 * 3600
+# 抓取頻道頁面時兩次請求之間的隨機延遲範圍（秒）
+CRAWL_DELAY = (1, 3)
+# 並行抓取時的限速：平均每秒請求數及每次請求的隨機抖動上限（秒）
+CRAWL_RATE = 2
+CRAWL_JITTER = 0.5
+# 連接池大小，需不小於並行抓取的執行緒數
+POOL_SIZE = 10
+
+# 頁面中Next.js資料標籤的標記
+NEXT_DATA_MARKER = b'id="__NEXT_DATA__"'
+BUILD_ID_PATTERN = re.compile(rb'"buildId"\s*:\s*"([^"]+)"')
+
+
+def extract_next_data(content):
+    """
+    直接在原始位元組中尋找<script id="__NEXT_DATA__">並將內容交給JSON解析器
+    Next.js會將JSON中的'<'轉義，因此內容中不會出現</script>
+    找不到標籤時返回None，JSON無效時拋出ValueError
+    """
+    marker = content.find(NEXT_DATA_MARKER)
+    if marker == -1:
+        return None
+    start = content.find(b'>', marker)
+    if start == -1:
+        return None
+    end = content.find(b'</script>', start)
+    if end == -1:
+        return None
+    return json.loads(content[start + 1:end])
+
+
+def extract_next_data_soup(html):
+    """使用BeautifulSoup完整解析HTML尋找__NEXT_DATA__，只在快速掃描失敗時使用"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+
+    if script_tag and script_tag.string:
+        return json.loads(script_tag.string)
+    return None
+
+
+def create_session(pool_size=POOL_SIZE):
+    """建立帶有連接池的HTTP會話，pool_size需不小於共用此會話的並行執行緒數"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+class OfiiiClient:
+    """
+    ofiii共用客戶端
+    每次執行只發現一次Next.js buildId (並保存到緩存檔案)，之後透過輕量的
+    _next/data/{buildId}/channel/watch/{id}.json 端點獲取頻道資料；
+    端點返回404表示網站已重新部署，會重新發現buildId後重試
+    """
+
+    def __init__(self, session=None, cache_file=BUILD_ID_CACHE_FILE, ttl=BUILD_ID_TTL, pool_size=POOL_SIZE):
+        self.session = session or create_session(pool_size)
+        self.session.headers.update(HEADERS)
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._build_id = None
+        self._lock = threading.Lock()
+
+    def _load_cached_build_id(self):
+        try:
+            data = load_json_cache(self.cache_file)
+            if data and time.time() - data.get('discovered_at', 0) < self.ttl:
+                return data.get('build_id')
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_cached_build_id(self, build_id):
+        save_json_cache(self.cache_file, {'build_id': build_id, 'discovered_at': time.time()})
+
+    def discover_build_id(self):
+        """從首頁HTML中找出目前的buildId"""
+        response = self.session.get(BASE_URL + "/", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        match = BUILD_ID_PATTERN.search(response.content)
+        if not match:
+            raise ValueError("首頁中找不到buildId")
+        return match.group(1).decode('utf-8')
+
+    def get_build_id(self, stale=None):
+        """
+        返回目前的buildId，必要時重新發現
+        stale為剛被404拒絕的buildId，只有目前值仍是它時才重新發現，
+        避免多個執行緒同時重新發現
+        """
+        with self._lock:
+            if self._build_id is None and stale is None:
+                self._build_id = self._load_cached_build_id()
+                if self._build_id:
+                    print(f"🔑 使用緩存的buildId: {self._build_id}")
+            if self._build_id is None or self._build_id == stale:
+                self._build_id = self.discover_build_id()
+                self._save_cached_build_id(self._build_id)
+                print(f"🔑 發現buildId: {self._build_id}")
+            return self._build_id
+
+    def fetch_next_data(self, path):
+        """透過_next/data端點獲取頁面的pageProps，buildId失效時重新發現一次"""
+        build_id = self.get_build_id()
+        for attempt in range(2):
+            url = f"{BASE_URL}/_next/data/{build_id}/{path}.json"
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 404 and attempt == 0:
+                print(f"🔄 buildId {build_id} 已失效，重新發現")
+                build_id = self.get_build_id(stale=build_id)
+                continue
+            response.raise_for_status()
+            return response.json().get('pageProps', {})
+
+    def fetch_page_props(self, path):
+        """下載完整HTML頁面並從__NEXT_DATA__取出pageProps，作為_next/data端點不可用時的備用方式"""
+        response = self.session.get(f"{BASE_URL}/{path}", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        try:
+            next_data = extract_next_data(response.content)
+        except ValueError:
+            next_data = None
+        if next_data is None:
+            next_data = extract_next_data_soup(response.text)
+        if next_data is None:
+            raise ValueError("未找到__NEXT_DATA__標簽")
+        return next_data.get('props', {}).get('pageProps', {})
+
+    def get_channel_page_props(self, channel_id, max_retries=3):
+        """獲取頻道的pageProps，失敗時返回None"""
+        path = f"channel/watch/{channel_id}"
+
+        for attempt in range(max_retries):
+            try:
+                try:
+                    return self.fetch_next_data(path)
+                except (requests.HTTPError, ValueError) as e:
+                    print(f"⚠️ _next/data端點失敗，改用完整頁面: {channel_id}, {str(e)}")
+                    return self.fetch_page_props(path)
+            except requests.RequestException as e:
+                wait_time = random.uniform(1, 3) * (attempt + 1)
+                print(f"⚠️ 請求失敗 (嘗試 {attempt+1}/{max_retries}), 等待 {wait_time:.2f}秒: {str(e)}")
+                time.sleep(wait_time)
+            except ValueError as e:
+                print(f"⚠️ 解析頻道資料失敗: {channel_id}, {str(e)}")
+                return None
+
+        print(f"❌ 無法獲取頻道資料: {channel_id}")
+        return None
+
+
+def iter_channel_pages(channel_ids, client=None, delay=CRAWL_DELAY, workers=1, rate=CRAWL_RATE, limiter=None):
+    """
+    獲取頻道頁面，按channel_ids的順序產生 (channel_id, page_props)，獲取失敗時page_props為None
+    EPG、M3U及頻道JSON可共用同一次抓取，每個頻道每次執行只下載一次
+    workers大於1時以執行緒池並行獲取，所有執行緒共用client的連接池並受令牌桶限速，
+    結果仍按原順序產生，因此輸出與逐個獲取時完全相同；
+    最多只有workers * 2個頻道在途，下游處理較慢時不會累積大量已下載的頁面
+    @params:
+        channel_ids - 頻道ID列表，重複的ID只獲取一次 (List)
+        client      - 共用的OfiiiClient (OfiiiClient)
+        delay       - 逐個獲取時兩次請求之間的隨機延遲範圍（秒） (Tuple)
+        workers     - 並行執行緒數，1表示逐個獲取 (Int)
+        rate        - 並行獲取時平均每秒請求數 (Float)
+        limiter     - 與其他任務共用的令牌桶，None時按rate建立 (TokenBucket)
+    """
+    client = client or OfiiiClient()
+    channel_ids = list(dict.fromkeys(channel_ids))
+    
+    if workers <= 1:
+        for idx, channel_id in enumerate(channel_ids):
+            if idx and delay:
+                time.sleep(random.uniform(*delay))
+            yield channel_id, client.get_channel_page_props(channel_id)
+        return
+    
+    limiter = limiter or TokenBucket(rate, jitter=CRAWL_JITTER)
+    
+    def fetch(channel_id):
+        limiter.acquire()
+        return channel_id, client.get_channel_page_props(channel_id)
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for channel_id in channel_ids:
+                pending.append(executor.submit(fetch, channel_id))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # 下游提前停止時取消尚未開始的請求，只等待正在進行的請求
+            for future in pending:
+                future.cancel()
@@ -2,21 +2,14 @@ import os
 import sys
 import re
 import json
-import time
-import random
 import argparse
-import requests
-import datetime
-import pytz
-from bs4 import BeautifulSoup
-from xml.etree import ElementTree as ET
-from xml.dom import minidom
+from xmltv_writer import XMLTVWriter
+from programme import Programme, parse_timestamp
+from ofiii_client import CRAWL_RATE, OfiiiClient, iter_channel_pages
+from pipeline import threaded_stage
 
-# 全局時區設置
-TAIPEI_TZ = pytz.timezone('Asia/Taipei')
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-}
+# 抓取、解析、寫入各階段之間佇列的容量
+PIPELINE_QUEUE_SIZE = 4
 
 def parse_channel_list():
     """解析頻道清單檔案內容"""
@@ -216,40 +209,6 @@ def parse_channel_list():
     
     return channel_list
 
-def fetch_epg_data(channel_id, max_retries=3):
-    """獲取指定頻道的電視節目表數據"""
-    url = f"https://www.ofiii.com/channel/watch/{channel_id}"
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
-            response.raise_for_status()
-            
-            if not response.text.strip():
-                print(f"⚠️ 響應內容為空: {channel_id}")
-                return None
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            script_tag = soup.find('script', id='__NEXT_DATA__')
-            
-            if script_tag and script_tag.string:
-                try:
-                    return json.loads(script_tag.string)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ JSON解析失敗: {channel_id}, {str(e)}")
-                    return None
-            else:
-                print(f"⚠️ 未找到__NEXT_DATA__標簽: {channel_id}")
-                return None
-                
-        except requests.RequestException as e:
-            wait_time = random.uniform(1, 3) * (attempt + 1)
-            print(f"⚠️ 請求失敗 (嘗試 {attempt+1}/{max_retries}), 等待 {wait_time:.2f}秒: {str(e)}")
-            time.sleep(wait_time)
-    
-    print(f"❌ 無法獲取 電視節目表 數據: {channel_id}")
-    return None
-
 def parse_live_epg_data(json_data, channel_id):
     """解析直播頻道的電視節目表 JSON數據"""
     if not json_data:
@@ -265,24 +224,20 @@ def parse_live_epg_data(json_data, channel_id):
         
         for item in schedule:
             try:
-                start_utc = datetime.datetime.strptime(
-                    item['AirDateTime'], "%Y-%m-%dT%H:%M:%SZ"
-                ).replace(tzinfo=pytz.utc)
-                start_taipei = start_utc.astimezone(TAIPEI_TZ)
-                
-                duration = datetime.timedelta(seconds=item.get('Duration', 0))
-                end_taipei = start_taipei + duration
+                # AirDateTime為UTC時間，輸出時轉為台灣時間
+                start_time = parse_timestamp(item['AirDateTime'])
+                end_time = start_time + int(item.get('Duration', 0))
                 
                 program_info = item.get('program', {})
                 
-                programs.append({
-                    "channelName": channel_id,
-                    "programName": program_info.get('Title', '未知節目'),
-                    "description": program_info.get('Description', ''),
-                    "subtitle": program_info.get('SubTitle', ''),
-                    "start": start_taipei,
-                    "end": end_taipei
-                })
+                programs.append(Programme(
+                    channel_id,
+                    start_time,
+                    end_time,
+                    program_info.get('Title', '未知節目'),
+                    program_info.get('Description', ''),
+                    program_info.get('SubTitle', '')
+                ))
                 
             except (KeyError, ValueError, TypeError) as e:
                 print(f"⚠️ 跳過無效的節目數據: {channel_id}, {str(e)}")
@@ -319,20 +274,17 @@ def parse_vod_epg_data(json_data, channel_id):
                 if start_timestamp == 0:
                     continue
                     
-                start_taipei = datetime.datetime.fromtimestamp(start_timestamp / 1000, TAIPEI_TZ)
-                
+                # 時間戳及長度以毫秒為單位，捨去不足一秒的部分
                 duration_ms = item.get('length', 0)
-                duration = datetime.timedelta(milliseconds=duration_ms)
-                end_taipei = start_taipei + duration
                 
-                programs.append({
-                    "channelName": channel_id,
-                    "programName": item.get('title', '未知節目'),
-                    "description": item.get('vod_channel_description', ''),
-                    "subtitle": item.get('subtitle', ''),
-                    "start": start_taipei,
-                    "end": end_taipei
-                })
+                programs.append(Programme(
+                    channel_id,
+                    int(start_timestamp // 1000),
+                    int((start_timestamp + duration_ms) // 1000),
+                    item.get('title', '未知節目'),
+                    item.get('vod_channel_description', ''),
+                    item.get('subtitle', '')
+                ))
                 
             except (KeyError, ValueError, TypeError) as e:
                 print(f"⚠️ 跳過無效的時間格式: {channel_id}, {str(e)}")
@@ -396,138 +348,157 @@ def get_channel_info(json_data, channel_id):
         print(f"❌ 提取頻道信息失敗: {channel_id}, {str(e)}")
         return None
 
-def get_ofiii_epg():
-    """獲取歐飛電視節目表"""
-    print("="*50)
-    print("開始獲取歐飛電視節目表")
-    print("="*50)
-    
-    # 獲取頻道清單
-    channels = parse_channel_list()
-    if not channels:
-        print("❌ 無法解析頻道清單")
-        return [], []
-    
-    all_channels_info = []
-    all_programs = []
-    failed_channels = []
-    
-    # 遍歷所有頻道
-    for idx, channel_id in enumerate(channels):
-        print(f"\n處理頻道 [{idx+1}/{len(channels)}]: {channel_id}")
+class OfiiiEPGBuilder:
+    """
+    逐個頻道解析頁面資料，返回該頻道的頻道信息及節目，只保留統計數字
+    頁面資料可來自本腳本自行獲取，也可與generate_ofiii_m3u共用同一次抓取結果
+    """
+
+    def __init__(self, channel_ids):
+        self.channel_ids = channel_ids
+        self._wanted = set(channel_ids)
+        self.processed = 0
+        self.channel_count = 0
+        self.program_counts = {}
+        self.failed_channels = []
+
+    def add(self, channel_id, page_props):
+        """
+        處理一個頻道的pageProps，返回 (頻道信息, 節目列表)
+        page_props為None表示獲取失敗；獲取失敗或不在頻道清單中的頻道返回None
+        """
+        if channel_id not in self._wanted:
+            return None
+        self.processed += 1
+        print(f"\n處理頻道 [{self.processed}/{len(self.channel_ids)}]: {channel_id}")
+        
+        if page_props is None:
+            print(f"❌ 無法獲取 電視節目表 數據: {channel_id}")
+            self.failed_channels.append(channel_id)
+            return None
+        
+        # 與__NEXT_DATA__相同的結構
+        json_data = {'props': {'pageProps': page_props}}
         
-        # 獲取EPG數據
-        json_data = fetch_epg_data(channel_id)
-        if not json_data:
-            failed_channels.append(channel_id)
-            continue
-            
         # 提取頻道信息
         channel_info = get_channel_info(json_data, channel_id)
         if channel_info:
-            all_channels_info.append(channel_info)
+            self.channel_count += 1
         
         # 解析節目數據
         programs = parse_epg_data(json_data, channel_id)
-        all_programs.extend(programs)
-            
-        # 隨機延遲
-        if idx < len(channels) - 1:
-            delay = random.uniform(1, 3)
-            print(f"⏱️ 隨機延遲 {delay:.2f}秒")
-            time.sleep(delay)
-    
-    # 統計結果
-    print("\n" + "="*50)
-    print(f"✅ 成功獲取 {len(all_channels_info)} 個頻道信息")
-    print(f"✅ 成功獲取 {len(all_programs)} 個節目")
-    
-    if failed_channels:
-        print(f"⚠️ 失敗頻道 ({len(failed_channels)}): {', '.join(failed_channels)}")
-    
-    channel_counts = {}
-    for program in all_programs:
-        channel_counts[program["channelName"]] = channel_counts.get(program["channelName"], 0) + 1
-    
-    for channel, count in channel_counts.items():
-        print(f"📺 頻道 {channel}: {count} 個節目")
-    
-    print("="*50)
-    return all_channels_info, all_programs
+        for program in programs:
+            self.program_counts[program.channel] = self.program_counts.get(program.channel, 0) + 1
+        return channel_info, programs
 
-def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
-    """生成XMLTV格式的EPG數據"""
-    print(f"\n生成XMLTV檔案: {output_file}")
-    
-    root = ET.Element("tv", generator="OFIII-EPG-Generator", source="www.ofiii.com")
-    
-    # 添加頻道定義
-    for channel in channels_info:
-        channel_id = channel['id']
-        channel_name = channel['channelName']
+    def finish(self):
+        """輸出統計結果"""
+        print("\n" + "="*50)
+        print(f"✅ 成功獲取 {self.channel_count} 個頻道信息")
+        print(f"✅ 成功獲取 {sum(self.program_counts.values())} 個節目")
         
-        channel_elem = ET.SubElement(root, "channel", id=channel_id)
-        ET.SubElement(channel_elem, "display-name", lang="zh").text = channel_name
+        if self.failed_channels:
+            print(f"⚠️ 失敗頻道 ({len(self.failed_channels)}): {', '.join(self.failed_channels)}")
         
-        if channel.get('logo'):
-            ET.SubElement(channel_elem, "icon", src=channel['logo'])
+        for channel, count in self.program_counts.items():
+            print(f"📺 頻道 {channel}: {count} 個節目")
         
-        # 添加頻道描述到XMLTV
-        if channel.get('description'):
-            ET.SubElement(channel_elem, "desc", lang="zh").text = channel['description']
+        print("="*50)
+
+def get_ofiii_epg(output_file, extra_builders=(), workers=1, rate=CRAWL_RATE, client=None, limiter=None):
+    """
+    獲取歐飛電視節目表並寫入XMLTV檔案，返回頻道信息列表，失敗時返回空列表
+    抓取、解析及寫入分別在不同執行緒中進行，以有界佇列串接：寫入第N個頻道的同時
+    解析第N+1個頻道並下載後續頻道，記憶體用量只取決於在途的頻道數而非節目表大小
+    extra_builders 中的builder (例如 OfiiiM3UBuilder) 會收到同一次抓取的頁面資料，
+    其頻道清單中額外的頻道也會一併抓取
+    workers大於1時並行抓取，結果仍按頻道清單順序處理
+    client及limiter可傳入與其他任務共用的OfiiiClient及令牌桶
+    """
+    print("="*50)
+    print("開始獲取歐飛電視節目表")
+    print("="*50)
     
-    # 添加節目
-    program_count = 0
-    for program in programs:
-        try:
-            channel_id = program['channelName']
-            start_time = program['start'].strftime('%Y%m%d%H%M%S %z')
-            end_time = program['end'].strftime('%Y%m%d%H%M%S %z')
-            
-            program_elem = ET.SubElement(
-                root, 
-                "programme", 
-                channel=channel_id,
-                start=start_time, 
-                stop=end_time
-            )
-            
-            title = program.get('programName', '未知節目')
-            ET.SubElement(program_elem, "title", lang="zh").text = title
-            
-            if program.get('subtitle'):
-                ET.SubElement(program_elem, "sub-title", lang="zh").text = program['subtitle']
-            
-            if program.get('description'):
-                ET.SubElement(program_elem, "desc", lang="zh").text = program['description']
-            
-            program_count += 1
-        except Exception as e:
-            print(f"⚠️ 跳過無效的節目數據: {str(e)}")
-            continue
+    # 獲取頻道清單
+    channels = parse_channel_list()
+    if not channels:
+        print("❌ 無法解析頻道清單")
+        return []
     
-    # 生成XML
-    xml_str = ET.tostring(root, encoding='utf-8').decode('utf-8')
+    builder = OfiiiEPGBuilder(channels)
+    crawl_ids = list(channels)
+    for extra in extra_builders:
+        crawl_ids.extend(channel_id for channel_id in extra.channel_ids if channel_id not in crawl_ids)
     
+    def parse(page):
+        # 每個頻道只下載一次，同時交給所有builder處理
+        channel_id, page_props = page
+        for extra in extra_builders:
+            extra.add(channel_id, page_props)
+        return builder.add(channel_id, page_props)
+    
+    client = client or OfiiiClient(pool_size=max(workers, 1))
+    pages = threaded_stage(iter_channel_pages(crawl_ids, client, workers=workers, rate=rate, limiter=limiter),
+                           maxsize=PIPELINE_QUEUE_SIZE)
+    results = threaded_stage(pages, parse, maxsize=PIPELINE_QUEUE_SIZE)
     try:
-        parsed = minidom.parseString(xml_str)
-        pretty_xml = parsed.toprettyxml(indent="  ", encoding='utf-8')
-    except Exception as e:
-        print(f"⚠️ XML美化失敗, 使用原始XML: {str(e)}")
-        pretty_xml = xml_str.encode('utf-8')
+        channels_info = generate_xmltv(results, output_file)
+    finally:
+        # 寫入中途失敗時停止各階段的背景執行緒
+        results.close()
+    
+    builder.finish()
+    return channels_info
+
+def generate_xmltv(channel_results, output_file="ofiii.xml"):
+    """
+    生成XMLTV格式的EPG數據，返回頻道信息列表，失敗時返回空列表
+    channel_results為逐個頻道產生 (頻道信息, 節目列表) 的可迭代對象，
+    節目寫入暫存檔後接在所有頻道之後，因此不需要先收集全部節目
+    沒有任何有效頻道時不會覆蓋原有檔案
+    """
+    print(f"\n生成XMLTV檔案: {output_file}")
+    channels_info = []
     
     try:
-        with open(output_file, 'wb') as f:
-            f.write(pretty_xml)
+        with XMLTVWriter(output_file, {"generator": "OFIII-EPG-Generator", "source": "www.ofiii.com"},
+                         indent="  ", spool=True) as writer:
+            for channel, programs in channel_results:
+                # 添加頻道定義
+                if channel:
+                    channels_info.append(channel)
+                    writer.write_channel(
+                        channel['id'],
+                        channel['channelName'],
+                        lang="zh",
+                        icon=channel.get('logo'),
+                        # 添加頻道描述到XMLTV
+                        desc=channel.get('description')
+                    )
+                
+                # 添加節目
+                for program in programs:
+                    writer.write_programme(
+                        program.channel,
+                        program.xmltv_start(),
+                        program.xmltv_stop(),
+                        program.title,
+                        sub_title=program.sub_title,
+                        desc=program.desc
+                    )
+            
+            if not channels_info:
+                raise ValueError("未獲取到有效頻道信息")
         
         print(f"✅ XMLTV檔案已生成: {output_file}")
-        print(f"📺 頻道數: {len(channels_info)}")
-        print(f"📺 節目數: {program_count}")
+        print(f"📺 頻道數: {writer.channel_count}")
+        print(f"📺 節目數: {writer.programme_count}")
         print(f"💾 檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
-        return True
+        return channels_info
     except Exception as e:
         print(f"❌ 儲存XML檔案失敗: {str(e)}")
-        return False
+        return []
+
 
 def generate_json_file(channels_info, output_file="ofiii.json"):
     """生成JSON格式的頻道數據"""
@@ -556,6 +527,12 @@ def main():
     parser = argparse.ArgumentParser(description='歐飛電視節目表')
     parser.add_argument('--output', type=str, default='output/ofiii.xml', 
                        help='輸出XML檔案路徑 (默認: output/ofiii.xml)')
+    parser.add_argument('--with-m3u', action='store_true',
+                       help='共用同一次抓取，同時生成ofiii.m3u、ofiii_channel.json及ofiii_playout-channel.json')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='並行抓取的執行緒數，1表示逐個抓取 (默認: 1)')
+    parser.add_argument('--rate', type=float, default=CRAWL_RATE,
+                       help=f'並行抓取時平均每秒請求數 (默認: {CRAWL_RATE})')
     
     args = parser.parse_args()
     
@@ -566,22 +543,27 @@ def main():
         print(f"建立輸出目錄: {output_dir}")
     
     try:
-        # 獲取EPG數據
-        channels_info, programs = get_ofiii_epg()
+        extra_builders = []
+        if args.with_m3u:
+            from generate_ofiii_m3u import OfiiiM3UBuilder, get_channel_ids
+            m3u_builder = OfiiiM3UBuilder(get_channel_ids())
+            extra_builders.append(m3u_builder)
+        
+        # 獲取EPG數據並生成XMLTV檔案
+        channels_info = get_ofiii_epg(args.output, extra_builders, args.workers, args.rate)
         
         if not channels_info:
             print("❌ 未獲取到有效頻道信息，無法生成檔案")
             sys.exit(1)
             
-        # 生成XMLTV檔案
-        xml_output = args.output
-        if not generate_xmltv(channels_info, programs, xml_output):
-            sys.exit(1)
-            
         # 生成JSON檔案
         json_output = os.path.join(output_dir, "ofiii.json")
         if not generate_json_file(channels_info, json_output):
             print("⚠️ JSON檔案生成失敗，但XML已成功生成")
+        
+        # 生成M3U及頻道JSON檔案
+        if args.with_m3u:
+            m3u_builder.write(output_dir or '.')
             
     except Exception as e:
         print(f"❌ 主程序錯誤: {str(e)}")
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, quote, urljoin, urlparse
+
+import aiohttp
+from aiohttp import web
+from loguru import logger
+
+# 本地播放服務的監聽位址，與ofiii.m3u中的 http://localhost:5050/play/... 對應
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5050
+# 上游解析服務返回的JSON中播放地址所在的欄位，以.分隔，數字表示列表索引
+# 倉庫中沒有ofiii的播放地址解析實作，上游地址必須由--upstream指定
+DEFAULT_URL_FIELD = "url"
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://www.ofiii.com/'
+}
+REQUEST_TIMEOUT = 15
+# 解析結果的緩存時間（秒），URL帶有expires參數時不超過其過期時間
+RESOLVE_TTL = 600
+EXPIRY_MARGIN = 60
+MAX_CACHE_ENTRIES = 2048
+# 上游連線池大小
+MAX_CONNECTIONS = 100
+KEEPALIVE_TIMEOUT = 30
+HLS_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+URI_ATTR_PATTERN = re.compile(r'URI="([^"]+)"')
+
+
+def extract_playlist_url(data, field=DEFAULT_URL_FIELD):
+    """
+    按field指定的欄位路徑從上游返回的JSON中取出播放地址，例如 "url" 或 "data.urls.0"
+    欄位不存在或不是http(s)地址時返回None
+    """
+    for key in field.split('.'):
+        if isinstance(data, dict):
+            data = data.get(key)
+        elif isinstance(data, list) and key.isdigit() and int(key) < len(data):
+            data = data[int(key)]
+        else:
+            return None
+    if isinstance(data, str) and data.startswith(('http://', 'https://')):
+        return data
+    return None
+
+
+def url_ttl(url, ttl=RESOLVE_TTL):
+    """返回URL可緩存的秒數，URL帶有expires參數時提前EXPIRY_MARGIN秒過期"""
+    query = parse_qs(urlparse(url).query)
+    expires = [int(value) for key in ('expires', 'expires1') for value in query.get(key, []) if value.isdigit()]
+    if expires:
+        return max(0, min(ttl, min(expires) - time.time() - EXPIRY_MARGIN))
+    return ttl
+
+
+def rewrite_manifest(text, base_url):
+    """將播放清單中的相對URI改為上游的絕對地址，讓播放器直接從CDN獲取分片"""
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#'):
+            line = urljoin(base_url, stripped)
+        elif 'URI="' in line:
+            line = URI_ATTR_PATTERN.sub(lambda m: f'URI="{urljoin(base_url, m.group(1))}"', line)
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+class PlayUrlResolver:
+    """
+    按需解析節目的上游HLS地址
+    解析結果按TTL緩存；同一節目同時有多個請求時只向上游發送一次，
+    其他請求等待同一個結果 (請求合併)
+    """
+
+    def __init__(self, session, upstream_url, url_field=DEFAULT_URL_FIELD, ttl=RESOLVE_TTL,
+                 max_entries=MAX_CACHE_ENTRIES):
+        self.session = session
+        self.upstream_url = upstream_url
+        self.url_field = url_field
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.upstream_calls = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+
+    async def resolve(self, content_id, episode_id):
+        key = (content_id, episode_id)
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(content_id, episode_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 單一客戶端斷線不會取消其他客戶端共用的上游請求
+        return await asyncio.shield(task)
+
+    async def _fetch(self, content_id, episode_id):
+        self.upstream_calls += 1
+        url = self.upstream_url.format(content_id=quote(content_id, safe=''), episode_id=quote(episode_id, safe=''))
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            data = json.loads(await response.text())
+        playlist_url = extract_playlist_url(data, self.url_field)
+        if not playlist_url:
+            raise ValueError(f"上游返回的 {self.url_field} 欄位不是播放地址: {content_id}/{episode_id}")
+
+        ttl = url_ttl(playlist_url, self.ttl)
+        if ttl > 0:
+            self._cache[(content_id, episode_id)] = (time.monotonic() + ttl, playlist_url)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return playlist_url
+
+
+async def handle_play(request):
+    """GET /play/{content_id}/index.m3u8?episode_id=..."""
+    content_id = request.match_info['content_id']
+    episode_id = request.query.get('episode_id')
+    if not episode_id:
+        raise web.HTTPBadRequest(text="缺少episode_id參數")
+
+    resolver = request.app['resolver']
+    try:
+        playlist_url = await resolver.resolve(content_id, episode_id)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.warning(f"解析播放地址失敗 {content_id}/{episode_id}: {e}")
+        raise web.HTTPBadGateway(text="無法獲取播放地址")
+
+    if request.app['mode'] == 'redirect':
+        raise web.HTTPFound(playlist_url)
+
+    try:
+        async with resolver.session.get(playlist_url) as response:
+            response.raise_for_status()
+            text = await response.text()
+            base_url = str(response.url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"下載播放清單失敗 {playlist_url}: {e}")
+        raise web.HTTPBadGateway(text="無法下載播放清單")
+    return web.Response(text=rewrite_manifest(text, base_url), content_type=HLS_CONTENT_TYPE)
+
+
+async def create_app(upstream_url, mode='redirect', ttl=RESOLVE_TTL, url_field=DEFAULT_URL_FIELD):
+    """
+    建立播放服務，上游會話在整個服務生命週期內共用
+    upstream_url為解析服務的地址模板，{content_id}及{episode_id}會被替換，
+    返回的JSON中url_field欄位須為節目的HLS播放地址
+    """
+    app = web.Application()
+    app['mode'] = mode
+
+    async def session_context(app):
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+            app['resolver'] = PlayUrlResolver(session, upstream_url, url_field, ttl)
+            yield
+
+    app.cleanup_ctx.append(session_context)
+    app.router.add_get('/play/{content_id}/index.m3u8', handle_play)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ofiii 本地播放服務')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'監聽位址 (默認: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'監聽端口 (默認: {DEFAULT_PORT})')
+    parser.add_argument('--upstream', required=True,
+                        help='必須指向實際可用的播放地址解析服務，{content_id}及{episode_id}會被替換，'
+                             '例如 http://127.0.0.1:8000/resolve?content_id={content_id}&episode_id={episode_id}；'
+                             '本腳本不內建ofiii的解析API')
+    parser.add_argument('--url-field', default=DEFAULT_URL_FIELD,
+                        help=f'解析服務返回的JSON中播放地址所在的欄位，以.分隔 (默認: {DEFAULT_URL_FIELD})')
+    parser.add_argument('--mode', choices=['redirect', 'rewrite'], default='redirect',
+                        help='redirect: 302跳轉到上游地址；rewrite: 返回改寫為絕對地址的播放清單 (默認: redirect)')
+    parser.add_argument('--ttl', type=int, default=RESOLVE_TTL, help=f'解析結果緩存時間(秒) (默認: {RESOLVE_TTL})')
+    args = parser.parse_args()
+    try:
+        args.upstream.format(content_id='', episode_id='')
+    except (KeyError, IndexError, ValueError) as e:
+        parser.error(f"--upstream 只能包含 {{content_id}} 及 {{episode_id}} 佔位符: {e}")
+
+    logger.info(f"播放服務啟動: http://{args.host}:{args.port}/play/{{content_id}}/index.m3u8 ({args.mode})")
+    web.run_app(create_app(args.upstream, args.mode, args.ttl, args.url_field), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
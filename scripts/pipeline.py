@@ -0,0 +1,70 @@
+import queue
+import threading
+
+# 佇列中表示上游已結束的標記
+_DONE = object()
+# 佇列已滿時上游檢查下游是否已停止的間隔（秒）
+STOP_POLL_INTERVAL = 0.5
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def threaded_stage(items, func=None, maxsize=4):
+    """
+    在背景執行緒中逐個處理items，結果經有界佇列按原順序產生
+    多個階段串接時，下游處理當前項目的同時上游已在處理下一個項目，
+    佇列滿時上游會阻塞，因此同時存在的項目數只取決於佇列容量而非資料總量
+    func返回None的項目不會傳給下游；上游的例外會在下游重新拋出
+    下游停止迭代（例外或提前結束）時，背景執行緒不再處理新項目並關閉上游，
+    不會在已滿的佇列上永久阻塞，串接的上游階段及其在途請求也會隨之結束
+    @params:
+        items   - 上游的可迭代對象 (Iterable)
+        func    - 處理每個項目的函數，None表示原樣傳遞 (Callable)
+        maxsize - 佇列容量 (Int)
+    """
+    results = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(result):
+        """放入佇列，下游已停止時放棄並返回False"""
+        while not stop.is_set():
+            try:
+                results.put(result, timeout=STOP_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                result = func(item) if func else item
+                if result is not None and not put(result):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(_StageError(e))
+        finally:
+            # 關閉上游生成器，讓其執行清理（例如取消在途請求、停止更上游的階段）
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+    threading.Thread(target=run, daemon=True).start()
+
+    try:
+        while True:
+            result = results.get()
+            if result is _DONE:
+                return
+            if isinstance(result, _StageError):
+                raise result.error
+            yield result
+    finally:
+        stop.set()
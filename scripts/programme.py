@@ -0,0 +1,105 @@
+import calendar
+import sys
+import time
+
+# 台灣時間相對UTC的偏移（秒），台灣不實行夏令時間，所有提供者都使用固定偏移
+TAIPEI_OFFSET = 8 * 3600
+
+
+def intern_text(text):
+    """駐留重複出現的標題及簡介字串，相同內容的節目共用同一個字串對象"""
+    return sys.intern(text) if text else text
+
+
+def parse_timestamp(text, offset=0):
+    """
+    將 "YYYY-MM-DD HH:MM:SS" 或 "YYYY-MM-DDTHH:MM:SSZ" 格式的時間轉為epoch秒數
+    offset為該時間相對UTC的偏移（秒），格式不符時拋出ValueError
+    直接按位置切片，避免每個節目都經過strptime及時區對象
+    """
+    if len(text) < 19 or text[4] != '-' or text[7] != '-' or text[13] != ':' or text[16] != ':':
+        raise ValueError(f"無效的時間格式: {text}")
+    fields = (int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19]))
+    if not (1 <= fields[1] <= 12 and 1 <= fields[2] <= 31 and fields[3] < 24 and fields[4] < 60 and fields[5] < 60):
+        raise ValueError(f"無效的時間: {text}")
+    return calendar.timegm(fields + (0, 0, 0)) - offset
+
+
+def parse_xmltv_time(text):
+    """
+    將XMLTV時間 (例如 20250101080000 +0800 或 20250101080000+0800) 轉為 (epoch秒數, 偏移秒數)
+    沒有時區部分時視為UTC，格式不符時拋出ValueError
+    """
+    text = text.strip()
+    if len(text) < 14 or not text[:14].isdigit():
+        raise ValueError(f"無效的XMLTV時間: {text}")
+    zone = text[14:].strip()
+    offset = 0
+    if zone:
+        if len(zone) != 5 or zone[0] not in '+-' or not zone[1:].isdigit():
+            raise ValueError(f"無效的XMLTV時區: {text}")
+        offset = (int(zone[1:3]) * 3600 + int(zone[3:5]) * 60) * (-1 if zone[0] == '-' else 1)
+    local = f"{text[0:4]}-{text[4:6]}-{text[6:8]} {text[8:10]}:{text[10:12]}:{text[12:14]}"
+    return parse_timestamp(local, offset), offset
+
+
+def format_offset(offset):
+    """將偏移秒數轉為XMLTV的 +HHMM 格式"""
+    sign = '-' if offset < 0 else '+'
+    minutes = abs(offset) // 60
+    return f"{sign}{minutes // 60:02d}{minutes % 60:02d}"
+
+
+def format_xmltv_time(timestamp, offset=TAIPEI_OFFSET, sep=' '):
+    """將epoch秒數轉為XMLTV時間 (例如 20250101080000 +0800)，sep為時間與偏移之間的分隔字串"""
+    return time.strftime('%Y%m%d%H%M%S', time.gmtime(timestamp + offset)) + sep + format_offset(offset)
+
+
+class Programme:
+    """
+    所有提供者共用的節目記錄
+    以__slots__取代每個節目一個dict及兩個帶時區的datetime：開始及結束時間存為epoch秒數，
+    加上固定的UTC偏移；頻道、標題及簡介字串經過駐留，重複的內容只保存一份
+    @params:
+        channel   - 節目所屬頻道的鍵，各提供者用於分組的頻道ID或名稱 (Str)
+        start     - 開始時間epoch秒數 (Int)
+        stop      - 結束時間epoch秒數 (Int)
+        title     - 節目名稱 (Str)
+        desc      - 節目簡介 (Str)
+        sub_title - 副標題 (Str)
+        offset    - 輸出時使用的UTC偏移（秒） (Int)
+    """
+
+    __slots__ = ('channel', 'start', 'stop', 'title', 'desc', 'sub_title', 'offset')
+
+    def __init__(self, channel, start, stop, title, desc='', sub_title='', offset=TAIPEI_OFFSET):
+        self.channel = intern_text(channel)
+        self.start = start
+        self.stop = stop
+        self.title = intern_text(title)
+        self.desc = intern_text(desc)
+        self.sub_title = intern_text(sub_title)
+        self.offset = offset
+
+    def __repr__(self):
+        return f"Programme({self.channel!r}, {self.xmltv_start()}, {self.xmltv_stop()}, {self.title!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Programme):
+            return NotImplemented
+        return self.to_list() == other.to_list() and self.channel == other.channel
+
+    def xmltv_start(self, sep=' '):
+        return format_xmltv_time(self.start, self.offset, sep)
+
+    def xmltv_stop(self, sep=' '):
+        return format_xmltv_time(self.stop, self.offset, sep)
+
+    def to_list(self):
+        """緩存用的緊湊格式，頻道由緩存的鍵表示因此不保存"""
+        return [self.start, self.stop, self.offset, self.title, self.desc, self.sub_title]
+
+    @classmethod
+    def from_list(cls, channel, item):
+        start, stop, offset, title, desc, sub_title = item
+        return cls(channel, start, stop, title, desc, sub_title, offset)
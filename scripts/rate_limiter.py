@@ -0,0 +1,44 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    執行緒安全的令牌桶限速器
+    @params:
+        rate     - 每秒補充的令牌數，即平均每秒請求數 (Float)
+        capacity - 令牌桶容量，即允許的突發請求數 (Int)
+        jitter   - 取得令牌後額外的隨機延遲上限（秒），讓請求間隔不固定 (Float)
+    """
+
+    def __init__(self, rate, capacity=None, jitter=0.0):
+        if rate <= 0:
+            raise ValueError("rate 必須大於 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self.jitter = jitter
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """嘗試取得一個令牌，成功返回0，否則返回需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """阻塞直到取得令牌，再加上隨機抖動延遲"""
+        while True:
+            wait = self._reserve()
+            if not wait:
+                break
+            time.sleep(wait)
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
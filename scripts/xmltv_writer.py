@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from xml.sax.saxutils import escape
+
+# 屬性值中需要額外轉義的字元，與ElementTree的輸出一致
+ATTR_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def escape_attr(value):
+    return escape(str(value), ATTR_ENTITIES)
+
+
+class XMLTVWriter:
+    """
+    串流寫入XMLTV檔案，每個<channel>/<programme>轉義後直接寫入緩衝檔案，
+    不在記憶體中建立整棵XML樹，因此記憶體用量與節目表大小無關
+    @params:
+        output_file - 輸出檔案路徑，寫入暫存檔後於close()時原子替換 (Str)
+        root_attrs  - <tv>根元素的屬性 (Dict)
+        indent      - 縮排字串，None表示不換行不縮排 (Str)
+        spool       - 節目先寫入暫存檔，close()時接在所有頻道之後，
+                      讓頻道與節目可以交錯寫入而輸出仍符合XMLTV的頻道在前順序 (Bool)
+    """
+
+    def __init__(self, output_file, root_attrs=None, indent=None, spool=False):
+        self.output_file = output_file
+        self.indent = indent
+        self.channel_count = 0
+        self.programme_count = 0
+        self._tmp_file = output_file + '.tmp'
+        self._file = open(self._tmp_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self._spool = tempfile.TemporaryFile('w+', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) if spool else None
+        self._file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self._file.write(f'<tv{self._attrs(root_attrs)}>')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @staticmethod
+    def _attrs(attrs):
+        if not attrs:
+            return ''
+        return ''.join(f' {key}="{escape_attr(value)}"' for key, value in attrs.items() if value is not None)
+
+    def _newline(self, depth, out=None):
+        if self.indent is not None:
+            (out or self._file).write('\n' + self.indent * depth)
+
+    def write_element(self, tag, attrs=None, children=(), out=None):
+        """
+        寫入一個<tv>的子元素
+        @params:
+            tag      - 元素名稱 (Str)
+            attrs    - 屬性 (Dict)
+            children - 子元素 (tag, attrs, text) 列表，text為None時寫成空元素 (List)
+            out      - 寫入目標，默認為輸出檔案 (File)
+        """
+        out = out or self._file
+        self._newline(1, out)
+        out.write(f'<{tag}{self._attrs(attrs)}>')
+        for child_tag, child_attrs, text in children:
+            self._newline(2, out)
+            if text is None:
+                out.write(f'<{child_tag}{self._attrs(child_attrs)} />')
+            else:
+                out.write(f'<{child_tag}{self._attrs(child_attrs)}>{escape(str(text))}</{child_tag}>')
+        self._newline(1, out)
+        out.write(f'</{tag}>')
+
+    def write_channel(self, channel_id, display_name, lang=None, icon=None, desc=None):
+        """display_name可為多個名稱的列表，每個名稱寫成一個<display-name>"""
+        names = display_name if isinstance(display_name, (list, tuple)) else [display_name]
+        children = [('display-name', {'lang': lang}, name) for name in names]
+        if icon:
+            children.append(('icon', {'src': icon}, None))
+        if desc:
+            children.append(('desc', {'lang': lang}, desc))
+        self.write_element('channel', {'id': channel_id}, children)
+        self.channel_count += 1
+
+    def write_programme(self, channel, start, stop, title, sub_title=None, desc=None, lang='zh'):
+        children = [('title', {'lang': lang}, title)]
+        if sub_title:
+            children.append(('sub-title', {'lang': lang}, sub_title))
+        if desc:
+            children.append(('desc', {'lang': lang}, desc))
+        self.write_element('programme', {'channel': channel, 'start': start, 'stop': stop}, children, self._spool)
+        self.programme_count += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._spool is not None:
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, self._file, WRITE_BUFFER_SIZE)
+            self._spool.close()
+        self._newline(0)
+        self._file.write('</tv>\n')
+        self._file.close()
+        os.replace(self._tmp_file, self.output_file)
+
+    def abort(self):
+        """放棄寫入並刪除暫存檔，保留原有的輸出檔案"""
+        if not self._file.closed:
+            self._file.close()
+        if self._spool is not None and not self._spool.closed:
+            self._spool.close()
+        if os.path.exists(self._tmp_file):
+            os.remove(self._tmp_file)